@@ -1,10 +1,24 @@
 import argparse
+import bz2
+import json
 import logging
+import lzma
 import os
 import sys
-from bitstring import BitArray
+import tempfile
+import time
+import tracemalloc
+import zlib
 
-from core import HuffmanEncoder, HuffmanDecoder
+from core import (
+    CHUNK_SIZE, ENCODERS, FORMAT_VERSION, LEVELS, MAGIC, SAMPLE_CHUNKS, HuffmanEncoder,
+    HuffmanDecoder,
+    HuffmanStreamDecoder, HuffmanSearcher, HuffmanArchiveWriter, HuffmanArchiveReader,
+)
+
+
+# commands that are given as first argument instead of an input file
+COMMANDS = ['pack', 'unpack', 'list', 'bench', 'grep']
 
 
 class Interface:
@@ -20,6 +34,9 @@ class Interface:
         Compression or decompression is chosen automatically
         by the file extension of the input file.
         """
+        if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+            self.parse_command_args()
+            return
         parser = argparse.ArgumentParser(
             description='Compress and decompress files using the Huffman algorithm'
         )
@@ -44,14 +61,32 @@ class Interface:
             help='force overwrite output file if it already exists',
             action='store_true'
         )
+        parser.add_argument(
+            '-a',
+            '--append',
+            help='append the compressed input to an existing encoded output file',
+            action='store_true'
+        )
         parser.add_argument(
             '-l',
             '--level',
             type=int,
-            help='compression level (1-2)',
+            help=(
+                'compression level (1: single table, '
+                '3: table per preceding character, 4: tANS)'
+            ),
             required=False,
             default=1
         )
+        parser.add_argument(
+            '--fast-stats',
+            type=int,
+            nargs='?',
+            const=SAMPLE_CHUNKS,
+            metavar='CHUNKS',
+            help='estimate the character counts from a sample of evenly spaced chunks '
+                 f'(default: {SAMPLE_CHUNKS} chunks, levels 1 and 4)',
+        )
         parser.add_argument(
             '-v',
             '--verbose',
@@ -67,6 +102,139 @@ class Interface:
         self.args = vars(parser.parse_args())
         return
 
+    def parse_command_args(self):
+        """
+        This function parses the command line arguments of the
+        commands, which are given as the first argument.
+        """
+        common = argparse.ArgumentParser(add_help=False)
+        common.add_argument(
+            '-v',
+            '--verbose',
+            help='verbose mode',
+            action='store_true'
+        )
+        common.add_argument(
+            '-d',
+            '--debug',
+            help='debug mode',
+            action='store_true'
+        )
+        parser = argparse.ArgumentParser(
+            description='Compress and decompress files using the Huffman algorithm'
+        )
+        commands = parser.add_subparsers(dest='command', required=True)
+        pack = commands.add_parser(
+            'pack',
+            parents=[common],
+            help='pack the files of a directory into an archive with a shared code table',
+        )
+        pack.add_argument(
+            'input_dir',
+            type=str,
+            help='path to the directory',
+        )
+        pack.add_argument(
+            '-o',
+            '--output_file',
+            type=str,
+            help='path to the archive (default: <input_dir>.huffa)',
+            default=None,
+        )
+        pack.add_argument(
+            '-f',
+            '--force',
+            help='force overwrite output file if it already exists',
+            action='store_true'
+        )
+        unpack = commands.add_parser(
+            'unpack',
+            parents=[common],
+            help='extract all or the given members of an archive',
+        )
+        unpack.add_argument(
+            'input_file',
+            type=str,
+            help='path to the archive',
+        )
+        unpack.add_argument(
+            'members',
+            nargs='*',
+            type=str,
+            help='names of the members to extract (default: all)',
+        )
+        unpack.add_argument(
+            '-o',
+            '--output_dir',
+            type=str,
+            help='path to the output directory (default: current directory)',
+            default='.',
+        )
+        unpack.add_argument(
+            '-j',
+            '--jobs',
+            type=int,
+            help='number of processes that decode members in parallel',
+            default=1,
+        )
+        bench = commands.add_parser(
+            'bench',
+            parents=[common],
+            help='compare the compression levels with zlib, bz2 and lzma',
+        )
+        bench.add_argument(
+            'input_files',
+            nargs='+',
+            type=str,
+            help='paths to the files',
+        )
+        bench.add_argument(
+            '-r',
+            '--repeat',
+            type=int,
+            help='number of runs, the fastest run is reported',
+            default=1,
+        )
+        bench.add_argument(
+            '--json',
+            help='print the results as JSON',
+            action='store_true'
+        )
+        grep = commands.add_parser(
+            'grep',
+            parents=[common],
+            help='search encoded files without decoding all of them',
+        )
+        grep.add_argument(
+            'pattern',
+            type=str,
+            help='text to search for',
+        )
+        grep.add_argument(
+            'input_files',
+            nargs='+',
+            type=str,
+            help='paths to the encoded files',
+        )
+        grep.add_argument(
+            '-C',
+            '--context',
+            type=int,
+            help='number of lines printed before and after a match',
+            default=0,
+        )
+        list_ = commands.add_parser(
+            'list',
+            parents=[common],
+            help='list the members of an archive',
+        )
+        list_.add_argument(
+            'input_file',
+            type=str,
+            help='path to the archive',
+        )
+        self.args = vars(parser.parse_args())
+
     def initialize_logger(self):
         """
         This function initializes the logger and sets the
@@ -98,26 +266,65 @@ class Interface:
         return
 
     def check_mode(self):
+        """
+        This function selects compression or decompression.
+        Input files are checked by their file extension or,
+        if the extension is unknown, by the magic number in
+        their first bytes. Standard input is always checked
+        by the magic number. Standard input without magic number
+        is decoded as legacy format if it is not ASCII.
+        """
         if self.args['input_file'] is not None:
             if os.path.exists(self.args['input_file']):
                 if self.args['input_file'].endswith('.txt'):
                     self.args['mode'] = 'compression'
-                    self.log.info('compression mode selected')
                 elif self.args['input_file'].endswith('.huff'):
                     self.args['mode'] = 'decompression'
-                    self.log.info('decompression mode selected')
+                else:
+                    with open(self.args['input_file'], 'rb') as f:
+                        self.args['input_head'] = f.read(len(MAGIC))
             else:
                 self.log.error('Input file not found: %s', self.args['input_file'])
                 raise FileNotFoundError('Input file not found')
         else:
-            self.args['input_file'] = None
-            self.args['input_string'] = sys.stdin.read()
-            if self.args['input_string'].isascii():
-                self.args['mode'] = 'compression'
-                self.log.info('compression mode selected')
-            else:
+            # the head is read once and prepended to the rest of stdin
+            self.args['input_head'] = sys.stdin.buffer.read(len(MAGIC))
+        if 'mode' not in self.args:
+            if self.args['input_head'] == MAGIC:
                 self.args['mode'] = 'decompression'
-                self.log.info('decompression mode selected')
+            elif self.args['input_file'] is None:
+                # legacy streams have no magic number, but are not ASCII
+                if self.spool_stdin():
+                    self.args['mode'] = 'compression'
+                else:
+                    self.args['mode'] = 'decompression'
+            else:
+                self.args['mode'] = 'compression'
+        self.log.info('%s mode selected', self.args['mode'])
+
+    def spool_stdin(self):
+        """
+        This function spools the standard input, since it is read
+        twice when it is compressed, and returns whether it only
+        contains ASCII characters.
+        """
+        self.log.info('Reading standard input')
+        spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+        ascii = True
+        for chunk in self.read_stdin():
+            spool.write(chunk)
+            ascii = ascii and chunk.isascii()
+        self.args['input_spool'] = spool
+        self.args['input_size'] = spool.tell()
+        return ascii
+
+    def read_stdin(self):
+        """
+        This function yields the head and the rest of the
+        standard input in chunks of bytes.
+        """
+        yield self.args['input_head']
+        yield from iter(lambda: sys.stdin.buffer.read(CHUNK_SIZE), b'')
 
     def check_output_path(self):
         if self.args['output_file'] is False:  # output to stdout
@@ -136,101 +343,350 @@ class Interface:
                     self.args['output_file'] = 'output.txt'
 
     def check_output_file(self):
+        # the commands have no --append flag
+        append = self.args.get('append')
+        if append and self.args['mode'] != 'compression':
+            self.log.error('The --append flag only applies to compression')
+            raise ValueError('The --append flag only applies to compression')
         if self.args['output_file'] is None:  # output to stdout
+            if append:
+                self.log.error('The --append flag requires an output file')
+                raise ValueError('The --append flag requires an output file')
             return
         if os.path.exists(self.args['output_file']):
-            if not self.args['force']:
+            if append:
+                self.check_append_file()
+            elif not self.args['force']:
                 self.log.error('Output file already exists and --force flag not set')
                 raise FileExistsError('Output file already exists and --force flag not set')
 
+    def check_append_file(self):
+        """
+        This function checks that the output file can be appended
+        to. The new data is encoded as a member of its own, which
+        decoders only find after members of the current format.
+        """
+        with open(self.args['output_file'], 'rb') as f:
+            head = f.read(len(MAGIC) + 1)
+        if head != MAGIC + bytes([FORMAT_VERSION]):
+            message = 'Can only append to encoded files of format version'
+            self.log.error('%s %s', message, FORMAT_VERSION)
+            raise ValueError(f'{message} {FORMAT_VERSION}')
+        self.args['output_size'] = os.path.getsize(self.args['output_file'])
+        self.log.info('Appending to %s bytes', self.args['output_size'])
+
     def check_level(self):
-        if self.args['level'] in [1, 2]:
+        if self.args['level'] in LEVELS:
             self.log.info('Compression level set to %s', self.args['level'])
         else:
             self.log.error('Invalid compression level: %s', self.args['level'])
             raise ValueError('Invalid compression level')
 
-    def bits_to_bytes(self, bits, size=8, pad='0'):
-        """
-        This function converts a binary string into a byte array.
-        It was taken from https://stackoverflow.com/a/47311736.
-        """
-        chunks = [bits[n:n+size] for n in range(0, len(bits), size)]
-        if pad:
-            chunks[-1] = chunks[-1].ljust(size, pad)
-        return bytearray([int(c, 2) for c in chunks])
-
-    def bytes_to_bits(self, byte_array):
-        return BitArray(byte_array).bin
+    def check_fast_stats(self):
+        if self.args['fast_stats'] is None:
+            return
+        if self.args['mode'] != 'compression':
+            self.log.error('The --fast-stats flag only applies to compression')
+            raise ValueError('The --fast-stats flag only applies to compression')
+        if self.args['fast_stats'] < 1:
+            self.log.error('Invalid number of sample chunks: %s', self.args['fast_stats'])
+            raise ValueError('Invalid number of sample chunks')
+        if self.args['level'] == 3:
+            # the context tables need the counts of all character pairs
+            self.log.warning('The --fast-stats flag is ignored by level 3')
 
     def compress(self):
-        # read the input file
+        # standard input is spooled, since it is read twice
         if self.args['input_file'] is not None:
-            self.log.info('Reading input file: %s', self.args['input_file'])
-            with open(self.args['input_file'], 'r') as f:
-                self.args['input_string'] = f.read()
-        self.log.debug('Input string: %s', self.args['input_string'])
-        # compress the string
-        self.log.info('Starting HuffmanEncoder')
-        encoder = HuffmanEncoder(self.args['input_string'], self.args['level'], self.log)
-        encoded_string = encoder.encode()
-        self.log.info('Compression successful')
-        self.log.debug('Encoded string: %s', encoded_string)
-        self.log.debug('Encoded string length: %s', len(encoded_string))
-        self.log.debug('Converting bit sequence to byte array')
-        byte_array = self.bits_to_bytes(encoded_string)
-        self.log.debug('Byte array: %s', byte_array)
-        # write the encoded string to the output file
+            input_file = self.args['input_file']
+        else:
+            input_file = self.args['input_spool']
+        # compress the file in two passes with bounded memory
+        encoder = ENCODERS[self.args['level']](
+            input_file, self.args['level'], self.log,
+            sample_chunks=self.args['fast_stats']
+        )
+        self.log.info('Starting %s', type(encoder).__name__)
         if self.args['output_file'] is not None:
             self.log.info('Writing output file: %s', self.args['output_file'])
-            with open(self.args['output_file'], 'wb') as f:
-                f.write(byte_array)
+            mode = 'ab' if self.args['append'] else 'wb'
+            with open(self.args['output_file'], mode) as f:
+                try:
+                    encoder.encode_file(f)
+                except Exception:
+                    # the members of the file are kept, the partial member
+                    # is cut off, a new file is removed
+                    if 'output_size' in self.args:
+                        self.log.info(
+                            'Truncating output file to %s bytes', self.args['output_size']
+                        )
+                        f.truncate(self.args['output_size'])
+                    else:
+                        self.log.info(
+                            'Removing output file: %s', self.args['output_file']
+                        )
+                        f.close()
+                        os.remove(self.args['output_file'])
+                    raise
         else:
             self.log.info('Writing output to stdout')
-            print(byte_array, file=sys.stdout)
+            encoder.encode_file(sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        self.log.info('Compression successful')
 
     def decompress(self):
-        # read the input file
+        # read the input in chunks
         if self.args['input_file'] is not None:
             self.log.info('Reading input file: %s', self.args['input_file'])
-            with open(self.args['input_file'], 'rb') as f:
-                self.args['input_string'] = f.read()
-        self.log.debug('Encoded byte array: %s', self.args['input_string'])
-        # decompress the string
-        self.log.debug('Converting byte array to bit sequence')
-        encoded_string = self.bytes_to_bits(self.args['input_string'])
-        self.log.debug('Encoded string: %s', encoded_string)
-        self.log.debug('Encoded string length: %s', len(encoded_string))
-        self.log.info('Starting HuffmanDecoder')
-        string = HuffmanDecoder(encoded_string, self.log).decode()
-        # write the decoded string to the output file
-        if self.args['output_file'] is not None:
-            self.log.info('Writing output file: %s', self.args['output_file'])
-            with open(self.args['output_file'], 'w') as f:
-                f.write(string)
+            input_file = open(self.args['input_file'], 'rb')
+            chunks = iter(lambda: input_file.read(CHUNK_SIZE), b'')
+        elif 'input_spool' in self.args:
+            self.log.info('Standard input is not ASCII, decoding the legacy format')
+            input_file = self.args['input_spool']
+            input_file.seek(0)
+            chunks = iter(lambda: input_file.read(CHUNK_SIZE), b'')
         else:
-            self.log.info('Writing output to stdout')
-            print(string, file=sys.stdout)
+            self.log.info('Reading standard input')
+            input_file = None
+            chunks = self.read_stdin()
+        # decompress the chunks as they arrive
+        self.log.info('Starting HuffmanStreamDecoder')
+        decoder = HuffmanStreamDecoder(chunks, self.log)
+        try:
+            if self.args['output_file'] is not None:
+                self.log.info('Writing output file: %s', self.args['output_file'])
+                with open(self.args['output_file'], 'wb') as f:
+                    decoder.decode_to(f)
+            else:
+                self.log.info('Writing output to stdout')
+                decoder.decode_to(sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+        finally:
+            if input_file is not None:
+                input_file.close()
 
     def compression_ratio(self):
         if self.args['output_file'] is not None:
-            compressed_size = os.path.getsize(self.args['output_file'])
+            # only the appended bytes belong to the input
+            compressed_size = (
+                os.path.getsize(self.args['output_file'])
+                - self.args.get('output_size', 0)
+            )
         else:
             self.log.info('Compression ratio not available in stdout mode')
             return
         if self.args['input_file'] is not None:
             uncompressed_size = os.path.getsize(self.args['input_file'])
         else:
-            uncompressed_size = len(self.args['input_string'])
+            uncompressed_size = self.args['input_size']
         self.log.debug('Calculating compression ratio')
         compression_ratio = compressed_size / uncompressed_size * 100
         self.log.info(f'Compression ratio: {compression_ratio:.2f} %')
 
+    def pack(self):
+        """
+        This function packs all files below the input directory
+        into an archive. The members are named by their path
+        relative to the directory.
+        """
+        input_dir = self.args['input_dir']
+        if not os.path.isdir(input_dir):
+            self.log.error('Input directory not found: %s', input_dir)
+            raise FileNotFoundError('Input directory not found')
+        if self.args['output_file'] is None:
+            self.args['output_file'] = os.path.normpath(input_dir) + '.huffa'
+        self.check_output_file()
+        members = []
+        for root, dirs, files in os.walk(input_dir):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, input_dir).replace(os.sep, '/')
+                members.append((name, path))
+        self.log.info('Packing %s files', len(members))
+        writer = HuffmanArchiveWriter(members, self.log)
+        self.log.info('Writing output file: %s', self.args['output_file'])
+        with open(self.args['output_file'], 'wb') as f:
+            try:
+                writer.encode_archive(f)
+            except Exception:
+                self.log.info('Removing output file: %s', self.args['output_file'])
+                f.close()
+                os.remove(self.args['output_file'])
+                raise
+        self.log.info('Packing successful')
+
+    def unpack(self):
+        """
+        This function extracts the members of an archive into
+        the output directory.
+        """
+        reader = HuffmanArchiveReader(self.args['input_file'], self.log)
+        names = self.args['members'] or None
+        reader.extract(self.args['output_dir'], names, self.args['jobs'])
+
+    def list_members(self):
+        """
+        This function prints the members of an archive with
+        their original and encoded length.
+        """
+        reader = HuffmanArchiveReader(self.args['input_file'], self.log)
+        for name, (_, length, original_length) in reader.members.items():
+            print(f'{original_length:>12} {length:>12}  {name}')
+
+    def grep(self):
+        """
+        This function prints the offset and the lines of every
+        match of the pattern in the encoded files. Lines that
+        hold more than one match are printed once.
+        """
+        pattern = self.args['pattern'].encode('utf-8')
+        for input_file in self.args['input_files']:
+            with open(input_file, 'rb') as f:
+                searcher = HuffmanSearcher(f.read(), self.log)
+            end = -1
+            for offset in searcher.search(pattern):
+                if offset <= end:
+                    continue
+                if end != -1 and self.args['context']:
+                    sys.stdout.buffer.write(b'--\n')
+                start, end = searcher.context(offset, len(pattern), self.args['context'])
+                sys.stdout.buffer.write(
+                    f'{input_file}:{offset}:'.encode('utf-8')
+                    + searcher.decode_range(start, end) + b'\n'
+                )
+
+    def bench_codecs(self):
+        """
+        This function returns the name, the compression and the
+        decompression function of every benchmarked codec.
+        """
+        # the codecs log to their own logger to keep the timings clean
+        log = logging.getLogger('bench')
+        log.setLevel(logging.WARNING)
+
+        def huffman(level, engine):
+            # only level 1 can be decoded with a choice of engines
+            name = f'huffman level {level}' + (f' ({engine})' if level == 1 else '')
+            return (
+                name,
+                lambda data: (
+                    HuffmanEncoder(data.decode('ascii'), level, log).encode_bytes()
+                ),
+                lambda data: HuffmanDecoder(data, log, engine).decode().encode('ascii'),
+            )
+
+        codecs = [huffman(1, 'table'), huffman(1, 'tree')]
+        codecs += [huffman(level, 'table') for level in LEVELS if level != 1]
+        codecs += [
+            ('zlib', zlib.compress, zlib.decompress),
+            ('bz2', bz2.compress, bz2.decompress),
+            ('lzma', lzma.compress, lzma.decompress),
+        ]
+        return codecs
+
+    def measure(self, function, data):
+        """
+        This function runs the function on the data and returns
+        the fastest time of all runs, the peak memory of a run
+        measured with tracemalloc and the result.
+        """
+        times = []
+        for _ in range(max(self.args['repeat'], 1)):
+            start = time.perf_counter()
+            result = function(data)
+            times.append(time.perf_counter() - start)
+        # tracemalloc slows down the run, so it is measured separately
+        tracemalloc.start()
+        try:
+            function(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return min(times), peak, result
+
+    def bench(self):
+        """
+        This function compresses and decompresses the files with
+        every codec and reports the compression ratio, the speed
+        and the peak memory. Every run is checked for round-trip
+        correctness.
+        """
+        results = []
+        for input_file in self.args['input_files']:
+            with open(input_file, 'rb') as f:
+                data = f.read()
+            if not data:
+                self.log.warning('Skipping empty file: %s', input_file)
+                continue
+            for name, compress, decompress in self.bench_codecs():
+                self.log.info('Benchmarking %s on %s', name, input_file)
+                result = {'file': input_file, 'codec': name, 'size': len(data)}
+                try:
+                    compress_time, compress_peak, compressed = self.measure(
+                        compress, data
+                    )
+                    decompress_time, decompress_peak, decompressed = self.measure(
+                        decompress, compressed
+                    )
+                except ValueError as error:
+                    self.log.warning('%s failed on %s: %s', name, input_file, error)
+                    result['error'] = str(error)
+                    results.append(result)
+                    continue
+                if decompressed != data:
+                    self.log.error('%s does not round-trip %s', name, input_file)
+                    raise ValueError(f'{name} does not round-trip {input_file}')
+                result.update({
+                    'compressed_size': len(compressed),
+                    'ratio': len(compressed) / len(data) * 100,
+                    'compress_mb_s': len(data) / 1e6 / max(compress_time, 1e-9),
+                    'decompress_mb_s': len(data) / 1e6 / max(decompress_time, 1e-9),
+                    'compress_peak_mb': compress_peak / 1e6,
+                    'decompress_peak_mb': decompress_peak / 1e6,
+                })
+                results.append(result)
+        if self.args['json']:
+            print(json.dumps(results, indent=2))
+            return
+        print(
+            f'{"file":<20} {"codec":<26} {"ratio %":>8} {"comp MB/s":>10} '
+            f'{"decomp MB/s":>11} {"comp peak MB":>12} {"decomp peak MB":>14}'
+        )
+        for result in results:
+            file = os.path.basename(result['file'])[:20]
+            if 'error' in result:
+                print(f'{file:<20} {result["codec"]:<26} {result["error"]}')
+                continue
+            print(
+                f'{file:<20} {result["codec"]:<26} {result["ratio"]:>8.2f} '
+                f'{result["compress_mb_s"]:>10.2f} {result["decompress_mb_s"]:>11.2f} '
+                f'{result["compress_peak_mb"]:>12.2f} '
+                f'{result["decompress_peak_mb"]:>14.2f}'
+            )
+
+    def run_command(self):
+        if self.args['command'] == 'pack':
+            self.pack()
+        elif self.args['command'] == 'unpack':
+            self.unpack()
+        elif self.args['command'] == 'list':
+            self.list_members()
+        elif self.args['command'] == 'bench':
+            self.bench()
+        elif self.args['command'] == 'grep':
+            self.grep()
+
     def run(self):
         # initialize
         self.parse_args()
         self.initialize_logger()
+        if 'command' in self.args:
+            self.run_command()
+            return
         self.check_mode()
+        self.check_level()
+        self.check_fast_stats()
         self.check_output_path()
         self.check_output_file()
         # run the appropriate mode
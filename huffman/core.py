@@ -1,7 +1,126 @@
+import bisect
 import heapq
+import io
 import numpy as np
 import collections
+import concurrent.futures
+import itertools
 import logging
+import os
+import struct
+from bitarray import bitarray, decodetree
+
+
+# number of bytes read at once when encoding or decoding streams
+CHUNK_SIZE = 1 << 20
+# the magic number identifies encoded data, it is followed by
+# one byte holding the format version
+MAGIC = b'\x89HUF'
+FORMAT_VERSION = 2
+# The header of version 2 consists of the magic number, the format
+# version, the flags, the compression level, the length of the header
+# in bytes and the length of the original data in bytes. Readers skip
+# to the end of the header, so fields can be appended later on.
+# Version 1 only consists of the magic number and the format version
+# and is followed by the padding bits of the legacy format.
+HEADER = struct.Struct('>4sBBBHQ')
+# The flags of the header mark optional parts of the data. Data that
+# is encoded with one code table ends with an index, which holds the
+# bit offset of every INDEX_INTERVAL-th character, counted from the
+# start of the encoded characters. The offsets are followed by the
+# trailer with the interval, the number of offsets, the length of
+# the encoded data in bytes including header and index and the magic
+# number of the index, so the index is read from the end of the data.
+FLAG_INDEX = 1
+INDEX_MAGIC = b'HUFX'
+INDEX_INTERVAL = 1 << 16
+INDEX_TRAILER = struct.Struct('>IIQ4s')
+# compression levels that can be encoded and decoded:
+# 1: one code table for all characters
+# 3: one code table per preceding character (order-1 context)
+# 4: tabled asymmetric numeral systems (tANS)
+LEVELS = [1, 3, 4]
+# An archive starts with its own magic number, the format version,
+# the flags and the length of the header. The shared code table
+# follows, then the encoded members, each starting at a byte, and
+# the central directory. Every entry of the directory holds the
+# offset, the encoded length, the original length and the name of a
+# member. The trailer at the end of the archive holds the offset of
+# the directory, the number of members and the magic number.
+ARCHIVE_MAGIC = b'\x89HUA'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('>4sBBH')
+ARCHIVE_ENTRY = struct.Struct('>QQQH')
+ARCHIVE_TRAILER = struct.Struct('>QI4s')
+# maximum size of the padding, the number of codes and the code
+# table in bytes (128 codes with a padded length of 127 bits)
+MAX_TABLE_SIZE = (3 + 7 + 127 + 128 * (127 + 8)) // 8 + 1
+# longest code of the context tables, which limits the size of
+# their lookup tables when decoding
+MAX_CONTEXT_CODE_LENGTH = 12
+# maximum size of the context tables in bytes (number of tables,
+# contexts and 129 tables with bitmap and code lengths)
+MAX_CONTEXT_TABLE_SIZE = 1 + 128 + 129 * (1 + 16 + 64)
+# number of characters that are encoded at once by the context
+# encoder, which bounds the size of the intermediate lists
+CONTEXT_BLOCK_SIZE = 1 << 16
+# number of bits that the context decoder looks up at once, all the
+# characters whose codes are complete within them are decoded at once
+CONTEXT_RUN_BITS = 12
+# number of bytes of which the windows of CONTEXT_RUN_BITS bits at
+# every bit position are computed at once
+CONTEXT_SLICE_SIZE = 1 << 16
+# number of bits of the states of the tANS coder, its state table
+# has 1 << TANS_TABLE_LOG entries
+TANS_TABLE_LOG = 11
+# number of characters that are encoded into one block by the tANS
+# coder, every block starts with its length in bytes
+TANS_BLOCK_SIZE = 1 << 16
+TANS_BLOCK = struct.Struct('>I')
+# maximum size of the tANS table in bytes (table log, number of
+# characters and 128 characters with their normalized counts)
+MAX_TANS_TABLE_SIZE = 2 + 128 * 3
+# The character counts can be estimated from a sample of evenly spaced
+# chunks of the input instead of reading it twice. The sample consists
+# of SAMPLE_CHUNKS chunks of at most SAMPLE_CHUNK_SIZE bytes by default.
+SAMPLE_CHUNKS = 16
+SAMPLE_CHUNK_SIZE = 1 << 16
+
+
+def canonical_codes(lengths: dict):
+    """
+    This function assigns canonical Huffman codes to the
+    characters, given the length of their codes. Shorter
+    codes come first, characters of the same length are
+    sorted by their value.
+    """
+    codes = {}
+    code = 0
+    previous_length = 0
+    for char, length in sorted(lengths.items(), key=lambda item: (item[1], item[0])):
+        code <<= length - previous_length
+        codes[char] = bitarray(format(code, f'0{length}b'))
+        code += 1
+        previous_length = length
+    return codes
+
+
+def tans_spread(counts: dict, table_log: int):
+    """
+    This function spreads the characters over the states of
+    the tANS table, every character takes up as many states
+    as its normalized count. The step visits every state once
+    and scatters the states of a character over the table.
+    """
+    size = 1 << table_log
+    step = (size >> 1) + (size >> 3) + 3
+    spread = [0] * size
+    position = 0
+    for char in sorted(counts):
+        for _ in range(counts[char]):
+            spread[position] = char
+            position = (position + step) & (size - 1)
+    return spread
 
 
 class HuffmanNode:
@@ -49,16 +168,15 @@ class HuffmanEncoder:
         the Huffman tree.
         """
         self.log.info('Analyzing string...')
-        self.log.debug(f'Input string: {self.string}')
+        self.log.debug('Input string: %s', self.string)
         self.log.debug('Checking if string is empty...')
         if not self.string:
             self.log.error('The string is empty.')
             raise ValueError('The string is empty.')
         self.log.debug('String is not empty.')
         self.log.debug('Checking if string only contains ASCII characters...')
-        try:
-            np.fromstring(self.string, dtype='S1').astype('U1')
-        except UnicodeDecodeError:
+        # isascii checks the string without making a copy of it
+        if not self.string.isascii():
             self.log.error('Non-ASCII characters found in string.')
             self.log.debug('Checking which character is non-ASCII...')
             for i, char in enumerate(self.string):
@@ -71,9 +189,18 @@ class HuffmanEncoder:
         self.log.debug('String only contains ASCII characters.')
         self.log.debug('Counting characters...')
         d = collections.Counter(self.string)  # count the characters --> dict
+        self.build_heap(d)
+
+    def build_heap(self, frequencies):
+        """
+        This function creates the priority queue (heap) from
+        a dict that maps each character to its frequency.
+        """
+        self.frequencies = frequencies
         # use heapq to create a priority queue
         self.log.debug('Creating Huffman nodes and priority queue...')
-        for key, value in d.items():
+        self.heap = []
+        for key, value in frequencies.items():
             node = HuffmanNode(key, value)
             heapq.heappush(self.heap, node)
         self.log.debug('Priority queue created.')
@@ -117,7 +244,11 @@ class HuffmanEncoder:
             traverse_tree(node.right, current_code + '1')
 
         self.log.debug('Traversing Huffman tree...')
-        traverse_tree(self.tree)
+        if self.tree.char is not None:
+            # a single character still needs a code of one bit
+            self.codes[self.tree.char] = '0'
+        else:
+            traverse_tree(self.tree)
         self.log.debug('Codes built: %s', self.codes)
 
     def encode_array(self):
@@ -149,13 +280,15 @@ class HuffmanEncoder:
         pairs = codes + bin_chars
         identifier = '1' * max_length
         self.log.debug('Identifier: %s', identifier)
-        number = bin(len(self.codes))[2:].zfill(7)
+        # 128 codes do not fit into 7 bits and are written as 0, since
+        # a table without codes is never written
+        number = format(len(self.codes) % 128, '07b')
         self.log.debug('Number of codes: 0b%s', number)
         # The first 3 bits are reserved for the length of the right
         # padding, that is added to round the length of the encoded
         # bits to a multiple of 8.
         # After the identifier follows the number of codes as an 7-bit
-        # binary number (max. 128 codes = ASCII).
+        # binary number (max. 128 codes = ASCII, 0 for 128 codes).
         # Number of following ones identifies the length of the codes.
         # Since the order of codes is preserved, the first code will be
         # '0', thus determining the end of the identifier.
@@ -170,17 +303,20 @@ class HuffmanEncoder:
         tree.
         """
         self.log.info('Encoding string...')
-        self.encoded_string = ''
-        for char in self.string:
-            self.encoded_string += self.codes[char]
+        # bitarray encodes the string without intermediate strings
+        bits = bitarray()
+        codes = {char: bitarray(code) for char, code in self.codes.items()}
+        bits.encode(codes, self.string)
+        self.encoded_string = bits.to01()
         self.log.debug('String encoding finished: %s', self.encoded_string)
 
     def finalize_encoding(self):
         self.log.info('Finalizing encoding...')
-        self.finalized_string = self.encoded_array + self.encoded_string
-        length = bin(8 - ((len(self.finalized_string) + 3) % 8))[2:].zfill(3)
+        length = len(self.encoded_array) + len(self.encoded_string)
+        length = bin((8 - (length + 3) % 8) % 8)[2:].zfill(3)
         self.log.debug('Setting number of padding bits: 0b%s', length)
-        self.finalized_string = length + self.finalized_string
+        # join the parts at once to copy the encoded string only once
+        self.finalized_string = ''.join([length, self.encoded_array, self.encoded_string])
 
     def encode(self):
         """
@@ -197,6 +333,605 @@ class HuffmanEncoder:
         self.log.info('Encoding finished.')
         return self.finalized_string
 
+    def encode_bytes(self):
+        """
+        This function encodes the string with the encoder of
+        its compression level and returns the bytes, including
+        the header.
+        """
+        if self.level not in ENCODERS:
+            self.log.error('Invalid compression level: %s', self.level)
+            raise ValueError('Invalid compression level')
+        output = io.BytesIO()
+        encoder = ENCODERS[self.level](
+            io.BytesIO(self.string.encode('utf-8')), self.level, self.log
+        )
+        encoder.encode_file(output)
+        return output.getvalue()
+
+
+class HuffmanFileEncoder(HuffmanEncoder):
+    """
+    This class handles the encoding of a file with a bounded
+    amount of memory. The file is read twice in chunks: the
+    first pass counts the characters, the second pass encodes
+    the chunks and writes the packed bytes to the output as
+    soon as they are complete. The output is the same single
+    code table format that is produced by HuffmanEncoder.
+    With sample_chunks the first pass only reads that many
+    evenly spaced chunks and estimates the counts.
+    """
+    def __init__(self, input_file, level, log=logging.getLogger(), chunk_size=CHUNK_SIZE,
+                 sample_chunks=None):
+        super().__init__(None, level, log)
+        self.input_file = input_file
+        self.chunk_size = chunk_size
+        self.sample_chunks = sample_chunks
+        # length of the input if the counts are estimated
+        self.input_length = None
+        self.ratio_loss = None
+
+    def read_chunks(self):
+        """
+        This function reads the input file from the start
+        and yields it in chunks of bytes. The input file can
+        be a path or a seekable binary file object.
+        """
+        if hasattr(self.input_file, 'read'):
+            self.input_file.seek(0)
+            yield from iter(lambda: self.input_file.read(self.chunk_size), b'')
+            return
+        with open(self.input_file, 'rb') as f:
+            yield from iter(lambda: f.read(self.chunk_size), b'')
+
+    def read_ascii_chunks(self):
+        """
+        This function yields the chunks of the input file and
+        checks that the file is not empty and that it only
+        contains ASCII characters.
+        """
+        position = 0
+        for chunk in self.read_chunks():
+            if not chunk.isascii():
+                for i, byte in enumerate(chunk):
+                    if byte > 127:
+                        self.log.error('Non-ASCII characters found in file.')
+                        raise ValueError(
+                            f'Character {position+i+1} in file is non-ASCII.'
+                        )
+            yield chunk
+            position += len(chunk)
+        if not position:
+            self.log.error('The file is empty.')
+            raise ValueError('The file is empty.')
+        self.log.debug('Read %s characters.', position)
+
+    def input_size(self):
+        """
+        This function returns the size of the input file in
+        bytes without reading it.
+        """
+        if hasattr(self.input_file, 'read'):
+            return self.input_file.seek(0, io.SEEK_END)
+        return os.path.getsize(self.input_file)
+
+    def read_sample_chunks(self, size: int):
+        """
+        This function yields sample_chunks evenly spaced chunks
+        of the input file of the given size, the first chunk at
+        the start and the last chunk at the end of the file.
+        """
+        sample_size = min(self.chunk_size, SAMPLE_CHUNK_SIZE)
+        offsets = np.linspace(0, size - sample_size, self.sample_chunks).astype(np.int64)
+        f = self.input_file
+        if not hasattr(f, 'read'):
+            f = open(self.input_file, 'rb')
+        try:
+            for offset in offsets:
+                f.seek(int(offset))
+                yield f.read(sample_size)
+        finally:
+            if f is not self.input_file:
+                f.close()
+
+    def analyze_sample(self, size: int):
+        """
+        This function estimates the character counts from the
+        sample chunks and scales them to the size of the file.
+        Every ASCII character gets a count of at least one, so
+        characters that are not part of the sample still have
+        a code.
+        """
+        self.log.info('Estimating counts from %s chunks...', self.sample_chunks)
+        counts = np.zeros(256, dtype=np.int64)
+        for chunk in self.read_sample_chunks(size):
+            counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+        if counts[128:].any():
+            self.log.error('Non-ASCII characters found in file.')
+            raise ValueError('Non-ASCII characters found in file.')
+        estimate = counts[:128] * size // counts.sum() + 1
+        self.log.debug('Estimated counts: %s', estimate)
+        self.input_length = size
+        self.build_heap({chr(char): int(count) for char, count in enumerate(estimate)})
+
+    def analyze_file(self):
+        """
+        This function counts the characters of the file chunk
+        by chunk and creates the priority queue (heap). Files
+        that are larger than the sample are only sampled.
+        """
+        if self.sample_chunks:
+            size = self.input_size()
+            sample_size = min(self.chunk_size, SAMPLE_CHUNK_SIZE)
+            if size > self.sample_chunks * sample_size:
+                self.analyze_sample(size)
+                return
+            self.log.debug('The file is not larger than the sample.')
+        self.log.info('Analyzing file...')
+        frequencies = collections.Counter()
+        for chunk in self.read_ascii_chunks():
+            frequencies.update(chunk)
+        self.build_heap({chr(key): value for key, value in frequencies.items()})
+
+    def encode_file(self, output):
+        """
+        This function encodes the file and writes the packed
+        bytes to the binary output stream.
+        """
+        self.log.info('Encoding file...')
+        self.analyze_file()
+        self.build_tree()
+        self.build_codes()
+        self.encode_array()
+        # the header holds the original length, so the padding bits
+        # of the legacy format are not written
+        output.write(self.encode_header(1, FLAG_INDEX))
+        length = HEADER.size
+        bits = bitarray(self.encoded_array)
+        # number of written bits of the encoded characters
+        written = -len(bits)
+        codes = {ord(char): bitarray(code) for char, code in self.codes.items()}
+        checkpoints = []
+        position = 0
+        # the exact counts are taken while encoding estimated counts
+        counts = np.zeros(256, dtype=np.int64)
+        self.log.info('Writing encoded chunks...')
+        for chunk in self.read_ascii_chunks():
+            if self.input_length is not None:
+                counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+            chunk = memoryview(chunk)
+            start = 0
+            # the chunk is split at the characters of the index
+            while start < len(chunk):
+                if not position % INDEX_INTERVAL:
+                    checkpoints.append(written + len(bits))
+                end = min(len(chunk), start + INDEX_INTERVAL - position % INDEX_INTERVAL)
+                bits.encode(codes, chunk[start:end])
+                position += end - start
+                start = end
+            # write all complete bytes and keep the remaining bits
+            complete = len(bits) - len(bits) % 8
+            output.write(bits[:complete].tobytes())
+            length += complete // 8
+            written += complete
+            del bits[:complete]
+        rest = bits.tobytes()  # pads the last byte with zeros
+        output.write(rest)
+        output.write(self.encode_index(checkpoints, length + len(rest)))
+        if self.input_length is not None:
+            self.check_input_length(position)
+            self.report_ratio_loss(counts)
+        self.log.info('Encoding finished.')
+
+    def check_input_length(self, length: int):
+        """
+        This function checks that the second pass read as many
+        characters as the header holds, which is the size of
+        the file when it was sampled.
+        """
+        if length != self.input_length:
+            self.log.error('The file changed while encoding.')
+            raise ValueError('The file changed while encoding.')
+
+    def encoded_length(self, counts):
+        """
+        This function returns the number of bits of the data
+        with the given counts encoded with the codes.
+        """
+        lengths = np.zeros(256, dtype=np.int64)
+        for char, code in self.codes.items():
+            lengths[ord(char)] = len(code)
+        return int((counts * lengths).sum())
+
+    def optimal_length(self, counts):
+        """
+        This function returns the number of bits of the data
+        encoded with a Huffman code of the exact counts, which
+        is the sum of all merged counts of the tree.
+        """
+        heap = [int(count) for count in counts if count]
+        if len(heap) == 1:
+            return heap[0]  # a single character is encoded with one bit
+        heapq.heapify(heap)
+        length = 0
+        while len(heap) > 1:
+            merged = heapq.heappop(heap) + heapq.heappop(heap)
+            length += merged
+            heapq.heappush(heap, merged)
+        return length
+
+    def report_ratio_loss(self, counts):
+        """
+        This function compares the length of the data encoded
+        with the estimated counts with the length encoded with
+        the exact counts of the file and logs the difference.
+        """
+        length = self.encoded_length(counts)
+        optimal = self.optimal_length(counts)
+        # both lengths are 0 if nothing needs to be written
+        self.ratio_loss = length / optimal - 1 if optimal else 0.0
+        self.log.info(
+            'Estimated counts: %d bits instead of %d bits with exact counts (%+.3f %%).',
+            length, optimal, self.ratio_loss * 100
+        )
+
+    def encode_index(self, checkpoints: list, length: int):
+        """
+        This function returns the index that follows the encoded
+        data of the given length in bytes.
+        """
+        self.log.debug('Number of index entries: %s', len(checkpoints))
+        offsets = np.array(checkpoints, dtype='>u8').tobytes()
+        length += len(offsets) + INDEX_TRAILER.size
+        return offsets + INDEX_TRAILER.pack(
+            INDEX_INTERVAL, len(checkpoints), length, INDEX_MAGIC
+        )
+
+    def encode_header(self, level, flags=0):
+        """
+        This function returns the header that precedes the
+        encoded data of the given compression level.
+        """
+        original_length = self.input_length
+        if original_length is None:
+            original_length = sum(self.frequencies.values())
+        self.log.debug('Original length: %s', original_length)
+        return HEADER.pack(
+            MAGIC, FORMAT_VERSION, flags, level, HEADER.size, original_length
+        )
+
+
+class ContextHuffmanEncoder(HuffmanFileEncoder):
+    """
+    This class handles the encoding of a file with one code
+    table per preceding character (order-1 context). Contexts
+    whose own table would not pay off are pruned and share a
+    fallback table. The tables are stored compactly as the
+    lengths of canonical codes. The first character is coded
+    in the context of the NUL character.
+    """
+    def analyze_file(self):
+        """
+        This function counts the pairs of context and character
+        of the file chunk by chunk.
+        """
+        self.log.info('Analyzing file...')
+        self.pair_counts = np.zeros((256, 256), dtype=np.int64)
+        previous = 0
+        for chunk in self.read_ascii_chunks():
+            characters = np.frombuffer(chunk, dtype=np.uint8).astype(np.int64)
+            contexts = np.concatenate(([previous], characters[:-1]))
+            self.pair_counts += np.bincount(
+                contexts << 8 | characters, minlength=1 << 16
+            ).reshape(256, 256)
+            previous = int(characters[-1])
+        counts = self.pair_counts.sum(axis=0)
+        self.frequencies = {
+            int(char): int(counts[char]) for char in np.flatnonzero(counts)
+        }
+
+    def code_lengths(self, frequencies: dict):
+        """
+        This function returns the code length of every character
+        of the Huffman code for the frequencies. The frequencies
+        are halved until no code is longer than the maximum length.
+        """
+        while True:
+            heap = [HuffmanNode(char, freq) for char, freq in frequencies.items()]
+            heapq.heapify(heap)
+            while len(heap) > 1:
+                left = heapq.heappop(heap)
+                right = heapq.heappop(heap)
+                node = HuffmanNode(None, left.freq + right.freq, left, right)
+                heapq.heappush(heap, node)
+            lengths = {}
+
+            def traverse_tree(node, depth=0):
+                if node.char is not None:  # leaf node
+                    lengths[node.char] = max(depth, 1)
+                    return
+                traverse_tree(node.left, depth + 1)
+                traverse_tree(node.right, depth + 1)
+
+            traverse_tree(heap[0])
+            if max(lengths.values()) <= MAX_CONTEXT_CODE_LENGTH:
+                return lengths
+            frequencies = {char: (freq + 1) // 2 for char, freq in frequencies.items()}
+
+    def table_size(self, number_of_codes: int):
+        """
+        This function returns the size of a stored table in
+        bytes. Tables with more than 16 characters store them
+        as bitmap, smaller tables as list.
+        """
+        return 1 + min(number_of_codes, 16) + (number_of_codes + 1) // 2
+
+    def build_tables(self):
+        """
+        This function builds the code table of every context.
+        A context keeps its own table if the bits it saves are
+        more than the size of the table, otherwise its pairs
+        are counted for the fallback table.
+        """
+        self.log.info('Building context tables...')
+        order_0 = self.code_lengths(self.frequencies)
+        fallback = np.zeros(256, dtype=np.int64)
+        tables = {}
+        for context in np.flatnonzero(self.pair_counts.sum(axis=1)):
+            row = self.pair_counts[context]
+            frequencies = {int(char): int(row[char]) for char in np.flatnonzero(row)}
+            lengths = self.code_lengths(frequencies)
+            own = sum(freq * lengths[char] for char, freq in frequencies.items())
+            own += (self.table_size(len(lengths)) + 1) * 8
+            shared = sum(freq * order_0[char] for char, freq in frequencies.items())
+            if own < shared:
+                tables[int(context)] = lengths
+            else:
+                fallback += row
+        self.contexts = list(tables)
+        self.log.debug('Contexts with own table: %s', len(self.contexts))
+        fallback = {int(char): int(fallback[char]) for char in np.flatnonzero(fallback)}
+        self.tables = [self.code_lengths(fallback) if fallback else {}]
+        self.tables += list(tables.values())
+        # map every pair of context and character to its code
+        codes = [canonical_codes(lengths) for lengths in self.tables]
+        table_numbers = {context: i for i, context in enumerate(self.contexts, 1)}
+        self.pair_codes = {}
+        for context, char in zip(*np.nonzero(self.pair_counts)):
+            table = codes[table_numbers.get(int(context), 0)]
+            self.pair_codes[int(context) << 8 | int(char)] = table[int(char)]
+
+    def encode_tables(self):
+        """
+        This function encodes the tables into bytes: the number
+        of tables, the contexts of all tables but the fallback
+        table and every table as the number of characters, the
+        characters and their code lengths as 4-bit numbers.
+        """
+        self.log.info('Encoding tables...')
+        data = bytearray([len(self.tables)])
+        data += bytes(self.contexts)
+        for lengths in self.tables:
+            chars = sorted(lengths)
+            data.append(len(chars))
+            if len(chars) > 16:
+                bitmap = bitarray(128)
+                bitmap.setall(0)
+                for char in chars:
+                    bitmap[char] = 1
+                data += bitmap.tobytes()
+            else:
+                data += bytes(chars)
+            nibbles = [lengths[char] for char in chars] + [0]
+            pairs = zip(nibbles[::2], nibbles[1::2])
+            data += bytes(high << 4 | low for high, low in pairs)
+        self.log.debug('Tables size: %s bytes', len(data))
+        return bytes(data)
+
+    def encode_file(self, output):
+        """
+        This function encodes the file and writes the packed
+        bytes to the binary output stream.
+        """
+        self.log.info('Encoding file...')
+        self.analyze_file()
+        self.build_tables()
+        output.write(self.encode_header(3))
+        output.write(self.encode_tables())
+        self.log.info('Writing encoded chunks...')
+        bits = bitarray()
+        previous = 0
+        for chunk in self.read_chunks():
+            characters = np.frombuffer(chunk, dtype=np.uint8).astype(np.int64)
+            contexts = np.concatenate(([previous], characters[:-1]))
+            pairs = contexts << 8 | characters
+            for start in range(0, len(pairs), CONTEXT_BLOCK_SIZE):
+                block = pairs[start:start + CONTEXT_BLOCK_SIZE]
+                bits.encode(self.pair_codes, block.tolist())
+            previous = int(characters[-1])
+            # write all complete bytes and keep the remaining bits
+            complete = len(bits) - len(bits) % 8
+            output.write(bits[:complete].tobytes())
+            del bits[:complete]
+        output.write(bits.tobytes())  # pads the last byte with zeros
+        self.log.info('Encoding finished.')
+
+
+class TansEncoder(HuffmanFileEncoder):
+    """
+    This class handles the encoding of a file with tabled
+    asymmetric numeral systems (tANS). The character counts
+    of the first pass are normalized to the size of the state
+    table, so a character is not rounded to a whole number of
+    bits. tANS encodes backwards, so the file is encoded in
+    blocks, which start with the state the decoder starts with.
+    """
+    def normalize_counts(self):
+        """
+        This function scales the character counts of the first
+        pass to the size of the state table.
+        """
+        self.log.info('Normalizing counts...')
+        self.counts = self.normalized_counts(
+            {ord(char): freq for char, freq in self.frequencies.items()}
+        )
+        self.log.debug('Normalized counts: %s', self.counts)
+
+    def normalized_counts(self, frequencies: dict):
+        """
+        This function scales the counts of the characters to the
+        size of the state table. Every character keeps at least
+        one state, the rounding error is corrected at the most
+        frequent characters.
+        """
+        size = 1 << TANS_TABLE_LOG
+        total = sum(frequencies.values())
+        counts = {
+            char: max(1, round(freq * size / total)) for char, freq in frequencies.items()
+        }
+        most_frequent = max(frequencies, key=frequencies.get)
+        difference = size - sum(counts.values())
+        if difference > 0:
+            counts[most_frequent] += difference
+        while difference < 0:
+            char = max(counts, key=counts.get)
+            counts[char] -= 1
+            difference += 1
+        return counts
+
+    def table_length(self, counts, normalized: dict):
+        """
+        This function returns the number of bits that the
+        characters of the given counts take with the normalized
+        counts, a character with count c takes about
+        log2(table size / c) bits. Every block adds its length
+        and its final state.
+        """
+        blocks = -(-int(sum(counts)) // TANS_BLOCK_SIZE)
+        return blocks * (8 * TANS_BLOCK.size + TANS_TABLE_LOG) + sum(
+            int(count) * (TANS_TABLE_LOG - np.log2(normalized[char]))
+            for char, count in enumerate(counts) if count
+        )
+
+    def encoded_length(self, counts):
+        """
+        This function returns the approximate number of bits of
+        the data with the given counts encoded with the table.
+        """
+        return self.table_length(counts, self.counts)
+
+    def optimal_length(self, counts):
+        """
+        This function returns the approximate number of bits of
+        the data encoded with a table of the exact counts.
+        """
+        frequencies = {char: int(count) for char, count in enumerate(counts) if count}
+        return self.table_length(counts, self.normalized_counts(frequencies))
+
+    def build_table(self):
+        """
+        This function builds the encoding table. A character
+        with count c is encoded from the states that are shifted
+        into [c, 2c), the table maps them to the next state.
+        """
+        size = 1 << TANS_TABLE_LOG
+        self.table = [0] * size
+        # Every character has the number of bits that are written for
+        # it, one bit less if the state is below the threshold, and
+        # the position of its first entry minus its count.
+        self.chars = [None] * 256
+        self.max_bits = np.zeros(256, dtype=np.int64)
+        self.thresholds = np.zeros(256, dtype=np.int64)
+        offset = 0
+        for char in sorted(self.counts):
+            count = self.counts[char]
+            max_bits = TANS_TABLE_LOG + 1 - count.bit_length()
+            self.chars[char] = (max_bits, count << max_bits, offset - count)
+            self.max_bits[char] = max_bits
+            self.thresholds[char] = count << max_bits
+            offset += count
+        following = dict(self.counts)
+        for state, char in enumerate(tans_spread(self.counts, TANS_TABLE_LOG)):
+            self.table[self.chars[char][2] + following[char]] = size + state
+            following[char] += 1
+
+    def encode_counts(self):
+        """
+        This function encodes the normalized counts into bytes:
+        the table log, the number of characters and every
+        character with its count as 16-bit number.
+        """
+        data = bytearray([TANS_TABLE_LOG, len(self.counts)])
+        for char in sorted(self.counts):
+            data += struct.pack('>BH', char, self.counts[char])
+        return bytes(data)
+
+    def encode_block(self, block: bytes):
+        """
+        This function encodes a block of characters backwards.
+        The decoder reads the final state first and the bits of
+        the characters in forward order, so the written values
+        are reversed and packed into bytes by numpy.
+        """
+        size = 1 << TANS_TABLE_LOG
+        table, chars = self.table, self.chars
+        state = size
+        states = []
+        for char in reversed(block):
+            max_bits, threshold, start = chars[char]
+            states.append(state)
+            state = table[start + (state >> (max_bits - (state < threshold)))]
+        states.append(state - size)
+        states.reverse()
+        values = np.array(states, dtype=np.int64)
+        # the number of bits of every character is computed again
+        characters = np.frombuffer(block, dtype=np.uint8)
+        lengths = np.empty(len(values), dtype=np.int64)
+        lengths[0] = TANS_TABLE_LOG
+        shorter = values[1:] < self.thresholds[characters]
+        lengths[1:] = self.max_bits[characters] - shorter
+        values &= (1 << lengths) - 1
+        # every bit is shifted out of its value, counted from its end
+        shifts = np.repeat(np.cumsum(lengths), lengths) - 1 - np.arange(lengths.sum())
+        bits = (np.repeat(values, lengths) >> shifts) & 1
+        data = np.packbits(bits.astype(np.uint8)).tobytes()
+        return TANS_BLOCK.pack(len(data)) + data
+
+    def encode_file(self, output):
+        """
+        This function encodes the file and writes the blocks
+        to the binary output stream.
+        """
+        self.log.info('Encoding file...')
+        self.analyze_file()
+        self.normalize_counts()
+        self.build_table()
+        output.write(self.encode_header(4))
+        output.write(self.encode_counts())
+        self.log.info('Writing encoded blocks...')
+        buffer = bytearray()
+        position = 0
+        counts = np.zeros(256, dtype=np.int64)
+        for chunk in self.read_ascii_chunks():
+            if self.input_length is not None:
+                counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+            position += len(chunk)
+            buffer += chunk
+            blocks = len(buffer) // TANS_BLOCK_SIZE * TANS_BLOCK_SIZE
+            for start in range(0, blocks, TANS_BLOCK_SIZE):
+                output.write(self.encode_block(buffer[start:start + TANS_BLOCK_SIZE]))
+            del buffer[:blocks]
+        if buffer:
+            output.write(self.encode_block(buffer))
+        if self.input_length is not None:
+            self.check_input_length(position)
+            self.report_ratio_loss(counts)
+        self.log.info('Encoding finished.')
+
+
+# encoder of each compression level
+ENCODERS = {1: HuffmanFileEncoder, 3: ContextHuffmanEncoder, 4: TansEncoder}
+
 
 class HuffmanDecoder:
     """
@@ -205,10 +940,18 @@ class HuffmanDecoder:
     and decodes the string into the Huffman tree and the encoded
     data. The encoded data is then decoded using the Huffman
     tree. The decoded string is returned as a string.
+    Encoded bytes with a header are decoded as well. The engine
+    selects how the data is decoded: 'table' uses the decode
+    tree of bitarray, 'tree' walks the Huffman tree bit by bit.
     """
-    def __init__(self, encoded_string, log=logging.getLogger()):
+    def __init__(self, encoded_string, log=logging.getLogger(), engine='table'):
         self.encoded_string = encoded_string
         self.log = log
+        self.engine = engine
+        self.version = 0
+        self.flags = 0
+        self.level = 1
+        self.original_length = None
 
     def read_until(self, char: int, delete: bool = False):
         """
@@ -240,27 +983,140 @@ class HuffmanDecoder:
             self.encoded_string = self.encoded_string[number:]
         return result
 
+    def decode_header(self, data: bytes):
+        """
+        This function decodes the header at the start of the
+        encoded bytes and returns the length of the header.
+        Data without magic number is in the legacy format and
+        has no header.
+        """
+        self.log.info('Decoding header...')
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            self.log.debug('No magic number found.')
+            return 0
+        if len(data) <= len(MAGIC):
+            self.log.error('The header is truncated.')
+            raise ValueError('The header is truncated.')
+        self.version = data[len(MAGIC)]
+        self.log.debug('Format version: %s', self.version)
+        if self.version == 1:
+            return len(MAGIC) + 1
+        if self.version != FORMAT_VERSION:
+            self.log.error('Unsupported format version: %s', self.version)
+            raise ValueError(f'Unsupported format version: {self.version}')
+        if len(data) < HEADER.size:
+            self.log.error('The header is truncated.')
+            raise ValueError('The header is truncated.')
+        _, _, self.flags, self.level, header_length, self.original_length = (
+            HEADER.unpack_from(data)
+        )
+        self.log.debug('Flags: %s', self.flags)
+        self.log.debug('Compression level: %s', self.level)
+        self.log.debug('Original length: %s', self.original_length)
+        if header_length < HEADER.size:
+            self.log.error('Invalid header length: %s', header_length)
+            raise ValueError(f'Invalid header length: {header_length}')
+        if self.level not in LEVELS:
+            self.log.error('Unsupported compression level: %s', self.level)
+            raise ValueError(f'Unsupported compression level: {self.level}')
+        return header_length
+
+    def decode_index(self, data: bytes):
+        """
+        This function decodes the index at the end of the encoded
+        data. It returns the bit offsets of the characters of the
+        index, the number of characters between them and the
+        position of the index in the data.
+        """
+        self.log.debug('Decoding index...')
+        if len(data) < INDEX_TRAILER.size:
+            self.log.error('The index is truncated.')
+            raise ValueError('The index is truncated.')
+        interval, count, length, magic = INDEX_TRAILER.unpack_from(
+            data, len(data) - INDEX_TRAILER.size
+        )
+        position = len(data) - INDEX_TRAILER.size - 8 * count
+        if magic != INDEX_MAGIC or position < 0 or length > len(data) or not interval:
+            self.log.error('The index is truncated.')
+            raise ValueError('The index is truncated.')
+        checkpoints = np.frombuffer(data, dtype='>u8', count=count, offset=position)
+        self.log.debug('Number of index entries: %s', count)
+        return checkpoints.astype(np.int64), interval, position
+
+    def index_size(self):
+        """
+        This function returns the size of the index in bytes
+        that follows the encoded data of the decoded header.
+        """
+        if not self.flags & FLAG_INDEX:
+            return 0
+        count = -(-self.original_length // INDEX_INTERVAL)
+        return 8 * count + INDEX_TRAILER.size
+
     def decode_array(self):
         self.log.info('Decoding array...')
-        # read the length of the right padding and delete it
-        right_padding = int(self.read_next(3, delete=True), 2)
-        self.encoded_string = self.encoded_string[:-right_padding]
+        # read the length of the right padding
+        right_padding = int(self.read_next(3), 2)
         self.log.debug('Number of padding bits: %s', right_padding)
+        position = self.decode_codes(3)
+        # delete the code table and the padding with a single copy
+        self.encoded_string = self.encoded_string[
+            position:len(self.encoded_string) - right_padding
+        ]
+
+    def decode_codes(self, position: int = 0):
+        """
+        This function reads the number of codes and the code
+        table, starting at the position in the encoded string,
+        and returns the position after the table. The encoded
+        string is not copied while reading.
+        """
+        string = self.encoded_string
         # read the number of codes
-        number_of_codes = int(self.read_next(7, delete=True), 2)
+        number_of_codes = int(string[position:position + 7], 2) or 128
+        position += 7
         self.log.debug('Number of codes: %s', number_of_codes)
         # read until the first 0 is encountered
-        _, depth = self.read_until(0, delete=True)
+        end = string.find('0', position)
+        if end == -1:
+            raise ValueError('char not found')
+        depth = end - position
+        position = end
         # read the codes and the characters
         self.codes = {}
         self.log.debug('Start reading codes...')
         for _ in range(number_of_codes):
-            code = self.read_next(depth, delete=True)
-            char = self.read_next(8, delete=True)
+            code = string[position:position + depth]
+            char = string[position + depth:position + depth + 8]
             char = int(char, 2).to_bytes(1, 'big').decode('utf-8')
             self.codes[code] = char
-            # TODO: improve performance by using numpy arrays
+            position += depth + 8
+        if position > len(string):
+            self.log.error('The code table is truncated.')
+            raise ValueError('The code table is truncated.')
         self.log.debug('Reading codes finished: %s', self.codes)
+        return position
+
+    def decode_payload_codes(self, payload: bytes):
+        """
+        This function decodes the code table at the start of
+        the payload that follows the header. It returns the
+        encoded data as bitarray and the number of padding
+        bits at its end.
+        """
+        # only the code table is converted into a binary string
+        self.encoded_string = bitarray(bytes(payload[:MAX_TABLE_SIZE])).to01()
+        position = 0
+        right_padding = 0
+        if self.version < 2:
+            right_padding = int(self.read_next(3), 2)
+            self.log.debug('Number of padding bits: %s', right_padding)
+            position = 3
+        position = self.decode_codes(position)
+        bits = bitarray(self.encoded_string[position:])
+        bits.frombytes(payload[MAX_TABLE_SIZE:])
+        self.log.debug('Code table length: %s bits', position)
+        return bits, right_padding
 
     def decode_tree(self):
         """
@@ -311,37 +1167,1181 @@ class HuffmanDecoder:
                 traverse_tree(node.right, current_code + '1')
 
         self.log.debug('Removing unecessary branches.')
+        if self.tree.right is None:
+            # the tree of a single character must keep its root
+            self.log.debug('Tree optimization finished.')
+            return
         traverse_tree(self.tree)
         self.log.debug('Tree optimization finished.')
 
+    def build_decodetree(self):
+        """
+        This function collects the codes of the optimized tree
+        and builds the decode tree that is used by bitarray.
+        """
+        self.log.debug('Building decode tree...')
+        codes = {}
+
+        def traverse_tree(node, current_code=''):
+            if node.char is not None:  # leaf node
+                codes[ord(node.char)] = bitarray(current_code)
+                return
+            if node.left is not None:
+                traverse_tree(node.left, current_code + '0')
+            if node.right is not None:
+                traverse_tree(node.right, current_code + '1')
+
+        traverse_tree(self.tree)
+        self.char_codes = codes
+        self.decodetree = decodetree(codes)
+        # code lengths are looked up by numpy to count decoded bits
+        self.lengths = np.zeros(256, dtype=np.int64)
+        for char, code in codes.items():
+            self.lengths[char] = len(code)
+        self.max_length = int(self.lengths.max())
+
     def decode_data(self):
         """
         This function decodes the encoded data from the
-        encoded string.
+        encoded string by walking the Huffman tree. If the
+        original length is known, the output is allocated
+        upfront and the decoding stops after the last character.
         """
         self.log.info('Decoding data...')
-        self.decoded_string = ''
-        self.current = self.tree
+        decoded = bytearray(self.original_length or 0)
+        i = 0
+        current = self.tree
+        # the encoded data is a binary string or a bitarray
+        zero = 0 if isinstance(self.encoded_string, bitarray) else '0'
         for char in self.encoded_string:
-            if char == '0':
-                self.encoded_string = self.encoded_string[1:]
-                self.current = self.current.left
-            elif char == '1':
-                self.encoded_string = self.encoded_string[1:]
-                self.current = self.current.right
-            if self.current.char is not None:
-                self.decoded_string += self.current.char
-                self.current = self.tree
+            if char == zero:
+                current = current.left
+            else:
+                current = current.right
+            if current.char is not None:
+                if self.original_length is None:
+                    decoded.append(ord(current.char))
+                else:
+                    decoded[i] = ord(current.char)
+                i += 1
+                if i == self.original_length:
+                    break
+                current = self.tree
+        if self.original_length is not None and i < self.original_length:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        self.decoded_string = decoded.decode('ascii')
+        self.log.debug('String successfully decoded: %s', self.decoded_string)
+
+    def decode_data_table(self, bits: bitarray):
+        """
+        This function decodes the encoded data using the decode
+        tree of bitarray. If the original length is known, the
+        output is allocated upfront and filled by numpy.
+        """
+        self.log.info('Decoding data...')
+        self.build_decodetree()
+        symbols = bits.decode(self.decodetree)
+        if self.original_length is None:
+            self.decoded_string = bytes(symbols).decode('ascii')
+        else:
+            try:
+                decoded = np.fromiter(
+                    symbols, dtype=np.uint8, count=self.original_length
+                )
+            except ValueError:
+                self.log.error('The encoded data is truncated.')
+                raise ValueError('The encoded data is truncated.')
+            # the array is decoded without copying it into bytes
+            self.decoded_string = str(decoded, 'ascii')
         self.log.debug('String successfully decoded: %s', self.decoded_string)
 
     def decode(self):
         """
-        This function decodes the encoded string.
+        This function decodes the encoded string or bytes.
         """
         self.log.info('Decoding string...')
-        self.decode_array()
+        if isinstance(self.encoded_string, str):  # legacy binary string
+            self.decode_array()
+            self.decode_tree()
+            self.optimize_tree()
+            self.decode_data()
+            self.log.info('Decoding finished.')
+            return self.decoded_string
+        data = memoryview(self.encoded_string)
+        parts = []
+        while True:
+            decoded, end = self.decode_member(data)
+            parts.append(decoded)
+            data = data[end:]
+            # appended members follow the index of the previous member
+            if self.version < 2 or bytes(data[:len(MAGIC)]) != MAGIC:
+                break
+            self.log.debug('Decoding appended member...')
+        self.decoded_string = ''.join(parts)
+        self.log.info('Decoding finished.')
+        return self.decoded_string
+
+    def decode_member(self, data):
+        """
+        This function decodes the header and the payload at the
+        start of the encoded bytes. It returns the decoded string
+        and the position after the index of the payload.
+        """
+        position = self.decode_header(data)
+        payload = data[position:]
+        # every character is encoded by at least one bit of a Huffman
+        # code, tANS encodes frequent characters with less
+        if (
+            self.original_length is not None and self.level != 4
+            and len(payload) * 8 < self.original_length
+        ):
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        if self.level in DECODERS:
+            decoder = DECODERS[self.level](self.original_length, self.log)
+            start = decoder.decode_tables(payload)
+            decoded = decoder.decode_data(payload[start:], final=True).decode('ascii')
+            return decoded, len(data) - len(decoder.rest) + self.index_size()
+        bits, right_padding = self.decode_payload_codes(payload)
+        table_length = len(payload) * 8 - len(bits)
+        if right_padding:
+            del bits[-right_padding:]
         self.decode_tree()
         self.optimize_tree()
-        self.decode_data()
+        self.log.debug('Decoding engine: %s', self.engine)
+        if self.engine == 'table':
+            self.decode_data_table(bits)
+        elif self.engine == 'tree':
+            self.encoded_string = bits
+            self.decode_data()
+            self.build_decodetree()
+        else:
+            self.log.error('Unknown decoding engine: %s', self.engine)
+            raise ValueError(f'Unknown decoding engine: {self.engine}')
+        if self.version < 2:
+            return self.decoded_string, len(data)
+        # the encoded data ends with the byte of its last code
+        characters = np.frombuffer(self.decoded_string.encode('ascii'), dtype=np.uint8)
+        length = table_length + int(self.lengths[characters].sum())
+        return self.decoded_string, position + -(-length // 8) + self.index_size()
+
+
+class HuffmanStreamDecoder(HuffmanDecoder):
+    """
+    This class handles the decoding of a stream of bytes with a
+    bounded amount of memory. The header and the code table are
+    read from the first chunks, afterwards every chunk is decoded
+    as soon as it arrives and the characters are written to the
+    output.
+    """
+    def __init__(self, chunks, log=logging.getLogger()):
+        super().__init__('', log)
+        self.chunks = iter(chunks)
+
+    def unread(self, data):
+        """
+        This function puts bytes back in front of the chunks.
+        """
+        if data:
+            self.chunks = itertools.chain([bytes(data)], self.chunks)
+
+    def skip(self, size: int):
+        """
+        This function skips the given number of bytes of the
+        chunks and returns the last four skipped bytes.
+        """
+        tail = b''
+        while size:
+            chunk = next(self.chunks, b'')
+            if not chunk:
+                break
+            self.unread(chunk[size:])
+            tail = (tail + chunk[:size])[-len(INDEX_MAGIC):]
+            size -= len(chunk[:size])
+        return tail
+
+    def read_head(self):
+        """
+        This function reads chunks until the head of the
+        stream contains the header and the code table.
+        """
+        head = b''
+        for chunk in self.chunks:
+            head += chunk
+            if len(head) >= HEADER.size + max(
+                MAX_TABLE_SIZE, MAX_CONTEXT_TABLE_SIZE, MAX_TANS_TABLE_SIZE
+            ):
+                break
+        return head
+
+    def decode_head(self, payload):
+        """
+        This function decodes the code table from the head of
+        the payload and builds the decode tree.
+        """
+        self.bits, self.right_padding = self.decode_payload_codes(payload)
+        self.decode_tree()
+        self.optimize_tree()
+        self.build_decodetree()
+
+    def decode_bits(self, bits, limit=None):
+        """
+        This function decodes characters from the start of the
+        bits, but not more than limit characters, and deletes
+        the consumed bits. Less bits than the longest code are
+        left over, since they may end with an incomplete code.
+        """
+        parts = []
+        while True:
+            # no code is longer than the longest code, so this number
+            # of characters is decoded without an incomplete code
+            count = len(bits) // self.max_length
+            if limit is not None:
+                count = min(count, limit)
+            if not count:
+                return b''.join(parts)
+            part = bytes(itertools.islice(bits.decode(self.decodetree), count))
+            del bits[:int(self.lengths[np.frombuffer(part, dtype=np.uint8)].sum())]
+            parts.append(part)
+            if limit is not None:
+                limit -= count
+
+    def decode_rest(self, bits, limit=None):
+        """
+        This function decodes the bits that are left over at
+        the end of the stream, which must only hold complete
+        codes and padding bits.
+        """
+        try:
+            return bytes(itertools.islice(bits.decode(self.decodetree), limit))
+        except ValueError:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+
+    def decode_to(self, output):
+        """
+        This function decodes the stream and writes the decoded
+        bytes to the binary output stream.
+        """
+        self.log.info('Decoding stream...')
+        head = self.read_head()
+        while True:
+            payload = memoryview(head)[self.decode_header(head):]
+            if self.level in DECODERS:
+                rest = self.decode_tables_to(payload, output)
+            else:
+                self.decode_head(payload)
+                if self.original_length is not None:
+                    rest = self.decode_length_to(output)
+                else:
+                    self.decode_padded_to(output)
+            if self.version < 2:
+                break
+            # appended members follow the index of the previous member
+            self.unread(rest)
+            if self.flags & FLAG_INDEX and self.skip(self.index_size()) != INDEX_MAGIC:
+                break
+            head = self.read_head()
+            if not head.startswith(MAGIC):
+                break
+            self.log.debug('Decoding appended member...')
         self.log.info('Decoding finished.')
-        return self.decoded_string
+
+    def decode_tables_to(self, payload, output):
+        """
+        This function decodes a stream that was encoded with
+        one code table per preceding character or with tANS.
+        """
+        decoder = DECODERS[self.level](self.original_length, self.log)
+        position = decoder.decode_tables(payload)
+        output.write(decoder.decode_data(payload[position:]))
+        while decoder.remaining:
+            chunk = next(self.chunks, b'')
+            if not chunk:
+                break
+            output.write(decoder.decode_data(chunk))
+        output.write(decoder.decode_data(b'', final=True))
+        return decoder.rest
+
+    def decode_length_to(self, output):
+        """
+        This function decodes characters until the original
+        length is reached and returns the bytes after the last
+        code, which are read but not decoded.
+        """
+        bits = self.bits
+        remaining = self.original_length
+        for chunk in self.chunks:
+            decoded = self.decode_bits(bits, remaining)
+            output.write(decoded)
+            remaining -= len(decoded)
+            if not remaining:
+                # the encoded data ends with the byte of its last code
+                return bits[len(bits) % 8:].tobytes() + chunk
+            bits.frombytes(chunk)
+        decoded = self.decode_bits(bits, remaining)
+        rest = self.decode_rest(bits, remaining - len(decoded))
+        if len(decoded) + len(rest) < remaining:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        output.write(decoded + rest)
+        del bits[:int(self.lengths[np.frombuffer(rest, dtype=np.uint8)].sum())]
+        return bits[len(bits) % 8:].tobytes()
+
+    def decode_padded_to(self, output):
+        """
+        This function decodes a stream without header, which
+        ends with the number of padding bits given at its start.
+        """
+        bits = self.bits
+        for chunk in self.chunks:
+            bits.frombytes(chunk)
+            # the last byte may hold padding bits, so it is kept
+            # until the end of the stream is reached
+            tail = bits[-8:]
+            del bits[-8:]
+            output.write(self.decode_bits(bits))
+            bits.extend(tail)
+        if self.right_padding:
+            del bits[-self.right_padding:]
+        output.write(self.decode_rest(bits))
+
+
+class ContextHuffmanDecoder:
+    """
+    This class handles the decoding of data that was encoded
+    with one code table per preceding character. Every table
+    is expanded into a lookup table, that maps the next bits
+    to the character and the length of its code, and into a
+    lookup table of runs, that maps the next bits to all the
+    characters whose codes they complete. The data can be
+    decoded in chunks, the state is kept between the chunks.
+    """
+    def __init__(self, original_length, log=logging.getLogger()):
+        self.remaining = original_length
+        self.log = log
+        self.bits = 0  # bits that are not decoded yet
+        self.number_of_bits = 0
+        self.context = 0  # the first character follows NUL
+        self.rest = b''  # bytes after the last code
+
+    def decode_tables(self, data):
+        """
+        This function decodes the tables at the start of the
+        data and returns the number of bytes they take up.
+        """
+        self.log.info('Decoding tables...')
+        try:
+            number_of_tables = data[0]
+            contexts = data[1:number_of_tables]
+            position = number_of_tables
+            lookups = []
+            for _ in range(number_of_tables):
+                number_of_codes = data[position]
+                position += 1
+                if number_of_codes > 16:
+                    bitmap = bitarray()
+                    bitmap.frombytes(bytes(data[position:position + 16]))
+                    chars = [char for char, bit in enumerate(bitmap) if bit]
+                    position += 16
+                else:
+                    chars = list(data[position:position + number_of_codes])
+                    position += number_of_codes
+                nibbles = data[position:position + (number_of_codes + 1) // 2]
+                position += (number_of_codes + 1) // 2
+                lengths = {}
+                for i, char in enumerate(chars):
+                    nibble = nibbles[i // 2]
+                    lengths[char] = nibble >> 4 if i % 2 == 0 else nibble & 15
+                lookups.append(self.build_lookup(lengths))
+        except IndexError:
+            position = len(data) + 1
+        if position > len(data):
+            self.log.error('The code tables are truncated.')
+            raise ValueError('The code tables are truncated.')
+        self.log.debug('Number of tables: %s', number_of_tables)
+        # every context uses the fallback table unless it has its own
+        self.table_numbers = [0] * 256
+        for i, context in enumerate(contexts, 1):
+            self.table_numbers[context] = i
+        self.tables = lookups
+        self.lookups = [lookups[number] for number in self.table_numbers]
+        # the entries of the lookup tables of runs are decoded when
+        # they are used first
+        runs = [[None] * (1 << CONTEXT_RUN_BITS) for _ in lookups]
+        self.runs = [runs[number] for number in self.table_numbers]
+        self.partial_runs = {}
+        return position
+
+    def build_lookup(self, lengths: dict):
+        """
+        This function expands the canonical codes of a table
+        into a lookup table for the longest code length.
+        """
+        if not lengths:
+            return [], 0
+        depth = max(lengths.values())
+        lookup = [None] * (1 << depth)
+        for char, code in canonical_codes(lengths).items():
+            start = int(code.to01(), 2) << (depth - len(code))
+            lookup[start:start + (1 << (depth - len(code)))] = (
+                [(char, len(code))] * (1 << (depth - len(code)))
+            )
+        return lookup, depth
+
+    def decode_run(self, number: int, size: int, value: int):
+        """
+        This function decodes the characters whose codes are
+        complete within the value of the given size in bits,
+        starting with the table of the given number. It returns
+        the characters, their number, the number of their bits
+        and the last character. The runs of the following tables
+        are shared between the lookup tables, so they are cached.
+        """
+        key = (number, size, value)
+        if key in self.partial_runs:
+            return self.partial_runs[key]
+        lookup, depth = self.tables[number]
+        entry = None
+        if depth:
+            if size >= depth:
+                entry = lookup[value >> (size - depth)]
+            else:
+                entry = lookup[value << (depth - size)]
+        if entry is None or entry[1] > size:
+            run = (b'', 0, 0, 0)
+        else:
+            char, length = entry
+            rest = size - length
+            chars, count, bits, last = self.decode_run(
+                self.table_numbers[char], rest, value & ((1 << rest) - 1)
+            )
+            run = (
+                bytes([char]) + chars, count + 1, length + bits, last if bits else char
+            )
+        self.partial_runs[key] = run
+        return run
+
+    def decode_runs(self, buffer: bytes, position: int, decoded: bytearray, i: int,
+                    limit: int, context: int):
+        """
+        This function decodes the runs of the buffer, starting
+        at the bit position, into the decoded characters until
+        the last window of the buffer or the limit is reached.
+        It returns the bit position, the number of decoded
+        characters and the context.
+        """
+        padded = np.frombuffer(buffer + bytes(2), dtype=np.uint8).astype(np.uint32)
+        words = padded[:-2] << 16 | padded[1:-1] << 8 | padded[2:]
+        # the window holds the next bits of every bit position, it is
+        # indexed through a memoryview without converting it
+        windows = np.empty((len(words), 8), dtype=np.uint16)
+        for offset in range(8):
+            windows[:, offset] = (
+                words >> (24 - CONTEXT_RUN_BITS - offset) & ((1 << CONTEXT_RUN_BITS) - 1)
+            )
+        windows = memoryview(windows.ravel())
+        runs = self.runs
+        end = len(buffer) * 8 - CONTEXT_RUN_BITS
+        while position <= end and i <= limit:
+            value = windows[position]
+            table = runs[context]
+            run = table[value]
+            if run is None:
+                run = table[value] = self.decode_run(
+                    self.table_numbers[context], CONTEXT_RUN_BITS, value
+                )
+            chars, count, length, last = run
+            if not length:
+                break
+            position += length
+            decoded[i:i + count] = chars
+            i += count
+            context = last
+        return position, i, context
+
+    def decode_data(self, data, final=False):
+        """
+        This function decodes the characters of the data and
+        returns them. The bits of an incomplete code at the end
+        of the data are kept for the next call. If final is set,
+        the data is padded with zeros to decode the last codes.
+        """
+        # every character is encoded by at least one bit
+        decoded = bytearray(min(self.remaining, len(data) * 8 + self.number_of_bits))
+        bits, number_of_bits, context = self.bits, self.number_of_bits, self.context
+        lookups = self.lookups
+        position = 0
+        padding = 0
+        i = 0
+        # The runs are decoded from slices of the data, which start
+        # with the bits that are left over from the previous slice. A
+        # run cannot exceed the remaining characters, the characters
+        # at the end are decoded one by one.
+        limit = len(decoded) - CONTEXT_RUN_BITS
+        while i <= limit and position < len(data):
+            end = min(len(data), position + CONTEXT_SLICE_SIZE)
+            prefix = (number_of_bits + 7) // 8
+            buffer = bits.to_bytes(prefix, 'big') + bytes(data[position:end])
+            stop, i, context = self.decode_runs(
+                buffer, prefix * 8 - number_of_bits, decoded, i, limit, context
+            )
+            position = end
+            number_of_bits = len(buffer) * 8 - stop
+            bits = int.from_bytes(buffer[stop // 8:], 'big') & ((1 << number_of_bits) - 1)
+            if number_of_bits >= CONTEXT_RUN_BITS:
+                break  # the remaining characters or an invalid code
+        while i < len(decoded):
+            table, depth = lookups[context]
+            while number_of_bits < depth:
+                if position < len(data):
+                    bits = bits << 8 | data[position]
+                    position += 1
+                elif final:
+                    bits <<= 8
+                    padding += 8
+                else:
+                    break
+                number_of_bits += 8
+            if number_of_bits < depth:
+                break
+            entry = table[bits >> (number_of_bits - depth)] if depth else None
+            if entry is None:
+                self.log.error('The encoded data is invalid.')
+                raise ValueError('The encoded data is invalid.')
+            char, length = entry
+            number_of_bits -= length
+            if number_of_bits < padding:
+                self.log.error('The encoded data is truncated.')
+                raise ValueError('The encoded data is truncated.')
+            bits &= (1 << number_of_bits) - 1
+            decoded[i] = char
+            i += 1
+            context = char
+        self.bits, self.number_of_bits, self.context = bits, number_of_bits, context
+        self.remaining -= i
+        if not self.remaining:
+            # the encoded data ends with the byte of its last code,
+            # the whole bytes that are left over are kept
+            size = (number_of_bits - padding) // 8
+            self.rest += ((bits >> padding) & ((1 << size * 8) - 1)).to_bytes(size, 'big')
+            self.rest += bytes(data[position:])
+            self.bits, self.number_of_bits = 0, 0
+        if final and self.remaining:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        del decoded[i:]
+        return bytes(decoded)
+
+
+class TansDecoder:
+    """
+    This class handles the decoding of data that was encoded
+    with tabled asymmetric numeral systems. Every state of the
+    table holds its character, the number of bits to read and
+    the base of the next state. The bits of a block are turned
+    into a window of the following 16 bits for every position,
+    so a state is decoded with two lookups and a shift. The data
+    can be decoded in chunks, incomplete blocks are kept.
+    """
+    def __init__(self, original_length, log=logging.getLogger()):
+        self.remaining = original_length
+        self.log = log
+        self.buffer = bytearray()  # bytes of incomplete blocks
+        self.rest = b''  # bytes after the last block
+
+    def decode_tables(self, data):
+        """
+        This function decodes the normalized counts at the start
+        of the data, builds the decoding table and returns the
+        number of bytes the counts take up.
+        """
+        self.log.info('Decoding counts...')
+        try:
+            self.table_log, number_of_chars = data[0], data[1]
+            counts = {}
+            for i in range(number_of_chars):
+                char, count = struct.unpack_from('>BH', data, 2 + 3 * i)
+                counts[char] = count
+        except (IndexError, struct.error):
+            self.log.error('The normalized counts are truncated.')
+            raise ValueError('The normalized counts are truncated.')
+        size = 1 << self.table_log
+        if (
+            not 0 < self.table_log < 16
+            or sum(counts.values()) != size or 0 in counts.values()
+        ):
+            self.log.error('Invalid normalized counts.')
+            raise ValueError('Invalid normalized counts.')
+        self.log.debug('Normalized counts: %s', counts)
+        # the character, the number of bits, the shift of the window
+        # and the base of the next state of every state
+        self.states = []
+        following = dict(counts)
+        for char in tans_spread(counts, self.table_log):
+            number_of_bits = self.table_log + 1 - following[char].bit_length()
+            base = (following[char] << number_of_bits) - size
+            self.states.append((char, number_of_bits, 16 - number_of_bits, base))
+            following[char] += 1
+        return 2 + 3 * number_of_chars
+
+    def decode_block(self, data: bytes, count: int):
+        """
+        This function decodes count characters of a block.
+        """
+        padded = np.frombuffer(data + bytes(3), dtype=np.uint8).astype(np.uint32)
+        words = padded[:-2] << 16 | padded[1:-1] << 8 | padded[2:]
+        # the window holds the next 16 bits of every bit position, it
+        # is indexed through a memoryview without converting it
+        windows = np.empty((len(words), 8), dtype=np.uint16)
+        for offset in range(8):
+            windows[:, offset] = words >> (8 - offset)
+        windows = memoryview(windows.ravel())
+        states = self.states
+        state = windows[0] >> (16 - self.table_log)
+        position = self.table_log
+        decoded = bytearray(count)
+        try:
+            for i in range(count):
+                char, number_of_bits, shift, base = states[state]
+                decoded[i] = char
+                window = windows[position]
+                position += number_of_bits
+                state = base + (window >> shift)
+        except IndexError:
+            position = len(data) * 8 + 1
+        if position > len(data) * 8:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        return bytes(decoded)
+
+    def decode_data(self, data, final=False):
+        """
+        This function decodes the complete blocks of the data
+        and returns their characters. If final is set, the data
+        must end with a complete block.
+        """
+        self.buffer += data
+        parts = []
+        position = 0
+        while self.remaining and len(self.buffer) - position >= TANS_BLOCK.size:
+            (length,) = TANS_BLOCK.unpack_from(self.buffer, position)
+            start = position + TANS_BLOCK.size
+            if len(self.buffer) - start < length:
+                break
+            count = min(TANS_BLOCK_SIZE, self.remaining)
+            block = bytes(self.buffer[start:start + length])
+            parts.append(self.decode_block(block, count))
+            self.remaining -= count
+            position = start + length
+        del self.buffer[:position]
+        if not self.remaining:
+            self.rest = bytes(self.buffer)
+        if final and self.remaining:
+            self.log.error('The encoded data is truncated.')
+            raise ValueError('The encoded data is truncated.')
+        return b''.join(parts)
+
+
+# decoder of the compression levels that are not decoded by
+# HuffmanDecoder itself
+DECODERS = {3: ContextHuffmanDecoder, 4: TansDecoder}
+
+
+class HuffmanSearcher(HuffmanDecoder):
+    """
+    This class searches encoded data for a pattern without
+    decoding all of it. The pattern is encoded with the code
+    table of the data and searched in the packed bits. A match
+    of the bits only counts if it starts with a code, which is
+    checked by decoding the characters from the preceding
+    offset of the index. Only the blocks of the index that hold
+    candidates and the lines around the matches are decoded.
+    Appended members are searched one after the other. Data
+    without index is decoded as a whole, data without magic
+    number is rejected.
+    """
+    def __init__(self, data, log=logging.getLogger()):
+        super().__init__(data, log)
+        self.blocks = {}  # decoded blocks by their number
+        self.read_data()
+
+    def find_members(self, data):
+        """
+        This function follows the lengths in the trailers of the
+        indexes from the end of the data and returns the start
+        and the end of every member, or None if a member has
+        no index.
+        """
+        members = []
+        end = len(data)
+        while end:
+            magic = bytes(data[end - len(INDEX_MAGIC):end])
+            if end < INDEX_TRAILER.size or magic != INDEX_MAGIC:
+                return None
+            _, _, length, _ = INDEX_TRAILER.unpack_from(data, end - INDEX_TRAILER.size)
+            magic = bytes(data[end - length:end - length + len(MAGIC)])
+            if length > end or magic != MAGIC:
+                return None
+            members.append((end - length, end))
+            end -= length
+        return members[::-1]
+
+    def read_member(self, data):
+        """
+        This function decodes the header, the code table and the
+        index of a member and returns its decoder.
+        """
+        member = HuffmanDecoder(data, self.log)
+        position = member.decode_header(data)
+        member.checkpoints, member.interval, end = member.decode_index(data)
+        member.bits, _ = member.decode_payload_codes(data[position:end])
+        member.decode_tree()
+        member.optimize_tree()
+        member.build_decodetree()
+        return member
+
+    def read_data(self):
+        """
+        This function reads the members of the data and numbers
+        the blocks of their indexes. The offset of the first
+        character of every block is kept, followed by the
+        original length.
+        """
+        self.log.info('Reading encoded data...')
+        data = memoryview(self.encoded_string)
+        # the legacy format has no magic number, so any other file
+        # would be decoded as legacy data
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            self.log.error('The file is not an encoded file.')
+            raise ValueError('The file is not an encoded file.')
+        members = self.find_members(data)
+        self.members = []
+        self.sources = []  # member and number of every block
+        starts = []
+        self.original_length = 0
+        if members is None:
+            self.log.info('No index found, decoding all data...')
+            self.blocks[0] = HuffmanDecoder(data, self.log).decode().encode('ascii')
+            starts.append(0)
+            self.original_length = len(self.blocks[0])
+        for start, end in members or []:
+            member = self.read_member(data[start:end])
+            member.offset = self.original_length
+            self.members.append(member)
+            for number in range(len(member.checkpoints)):
+                self.sources.append((member, number))
+                starts.append(member.offset + number * member.interval)
+            self.original_length += member.original_length
+        self.log.debug('Number of members: %s', len(self.members))
+        self.starts = starts + [self.original_length]
+
+    def number_of_blocks(self):
+        """
+        This function returns the number of blocks.
+        """
+        return len(self.starts) - 1
+
+    def block_at(self, position: int):
+        """
+        This function returns the number of the block that holds
+        the character at the position.
+        """
+        return bisect.bisect_right(self.starts, position) - 1
+
+    def decode_block(self, block: int):
+        """
+        This function decodes the characters between two offsets
+        of an index and returns them as bytes.
+        """
+        if block not in self.blocks:
+            member, number = self.sources[block]
+            start = member.checkpoints[number]
+            end = len(member.bits)
+            if number + 1 < len(member.checkpoints):
+                end = member.checkpoints[number + 1]
+            count = self.starts[block + 1] - self.starts[block]
+            try:
+                # the padding bits after the last block are not decoded
+                decoded = bytes(itertools.islice(
+                    member.bits[start:end].decode(member.decodetree), count
+                ))
+            except ValueError:
+                decoded = b''
+            if len(decoded) < count:
+                self.log.error('The encoded data is truncated.')
+                raise ValueError('The encoded data is truncated.')
+            self.blocks[block] = decoded
+        return self.blocks[block]
+
+    def find_bits(self, bits: bitarray, pattern_bits: bitarray):
+        """
+        This function returns the bit offsets of all occurrences
+        of the pattern in the bits in ascending order. Bits of at
+        least two bytes hold a whole byte for every alignment, so
+        the bytes are searched for these whole bytes and the
+        occurrences are compared bit by bit.
+        """
+        length = len(pattern_bits)
+        packed = bits.tobytes()
+        candidates = []
+        # the pattern starts skip bits before the first whole byte
+        for skip in range(8):
+            needle = pattern_bits[skip:skip + (length - skip) // 8 * 8].tobytes()
+            position = packed.find(needle)
+            while position != -1:
+                start = position * 8 - skip
+                if start >= 0 and bits[start:start + length] == pattern_bits:
+                    candidates.append(start)
+                position = packed.find(needle, position + 1)
+        return np.sort(np.array(candidates, dtype=np.int64))
+
+    def search_blocks(self, pattern: bytes, blocks):
+        """
+        This function decodes the blocks and searches them for
+        the pattern. Matches may reach into the next block.
+        """
+        matches = []
+        for block in blocks:
+            start = self.starts[block]
+            decoded = self.decode_block(block)
+            end = start + len(decoded)
+            decoded += self.decode_range(end, end + len(pattern) - 1)
+            offset = decoded.find(pattern)
+            while offset != -1 and start + offset < self.starts[block + 1]:
+                matches.append(start + offset)
+                offset = decoded.find(pattern, offset + 1)
+        return matches
+
+    def search_member(self, member, pattern: bytes):
+        """
+        This function searches the bits of a member for the
+        encoded pattern and returns the offsets of the matches
+        that lie within the member.
+        """
+        pattern_bits = bitarray()
+        try:
+            pattern_bits.encode(member.char_codes, pattern)
+        except ValueError:
+            self.log.debug('The pattern holds characters without code.')
+            return []
+        first = self.block_at(member.offset)
+        blocks = range(first, first + len(member.checkpoints))
+        # the last offset whose match ends within the member
+        last = member.offset + member.original_length - len(pattern)
+        # short patterns do not hold a whole byte for every alignment,
+        # searching their bits takes about as long as decoding
+        if len(pattern_bits) < 15:
+            self.log.debug('Searching decoded blocks...')
+            matches = self.search_blocks(pattern, blocks)
+            return [offset for offset in matches if offset <= last]
+        candidates = self.find_bits(member.bits, pattern_bits)
+        self.log.debug('Number of candidates: %s', len(candidates))
+        matches = []
+        if not len(candidates):
+            return matches
+        numbers = np.searchsorted(member.checkpoints, candidates, side='right') - 1
+        numbers, starts = np.unique(numbers, return_index=True)
+        # if most blocks have to be decoded for the candidates anyway,
+        # the decoded blocks are searched instead of every candidate
+        if len(numbers) * 2 >= len(member.checkpoints):
+            self.log.debug('Searching decoded blocks...')
+            matches = self.search_blocks(pattern, (blocks[number] for number in numbers))
+            return [offset for offset in matches if offset <= last]
+        for number, found in zip(numbers, np.split(candidates, starts[1:])):
+            decoded = self.decode_block(first + number)
+            lengths = member.lengths[np.frombuffer(decoded, dtype=np.uint8)]
+            # the bit offset of every character of the block
+            offsets = member.checkpoints[number] + np.cumsum(lengths) - lengths
+            index = np.minimum(np.searchsorted(offsets, found), len(offsets) - 1)
+            index = index[offsets[index] == found] + self.starts[first + number]
+            # the end of the pattern must not be decoded from padding bits
+            matches.extend(index[index <= last].tolist())
+        return matches
+
+    def search(self, pattern: bytes):
+        """
+        This function returns the offsets of all matches of the
+        pattern in the decoded data in ascending order.
+        """
+        if not pattern:
+            raise ValueError('The pattern is empty.')
+        self.log.info('Searching pattern...')
+        if not self.members:
+            return self.search_blocks(pattern, range(self.number_of_blocks()))
+        matches = []
+        for member in self.members:
+            matches += self.search_member(member, pattern)
+            # matches that reach into the next member are searched in
+            # the characters around the end of the member
+            end = member.offset + member.original_length
+            start = max(end - len(pattern) + 1, member.offset)
+            if end < self.original_length:
+                decoded = self.decode_range(start, end + len(pattern) - 1)
+                offset = decoded.find(pattern)
+                while offset != -1:
+                    matches.append(start + offset)
+                    offset = decoded.find(pattern, offset + 1)
+        self.log.debug('Number of matches: %s', len(matches))
+        return sorted(matches)
+
+    def rfind_newline(self, position: int):
+        """
+        This function returns the offset of the last newline
+        before the position, or -1 if there is none.
+        """
+        block = self.block_at(position - 1)
+        while position > 0:
+            start = self.starts[block]
+            offset = self.decode_block(block).rfind(b'\n', 0, position - start)
+            if offset != -1:
+                return start + offset
+            position = start
+            block -= 1
+        return -1
+
+    def find_newline(self, position: int):
+        """
+        This function returns the offset of the first newline
+        at or after the position, or the original length if
+        there is none.
+        """
+        block = self.block_at(position)
+        while 0 <= block < self.number_of_blocks():
+            start = self.starts[block]
+            offset = self.decode_block(block).find(b'\n', max(position - start, 0))
+            if offset != -1:
+                return start + offset
+            block += 1
+        return self.original_length
+
+    def decode_range(self, start: int, end: int):
+        """
+        This function decodes the characters from start to end.
+        """
+        parts = []
+        end = min(end, self.original_length)
+        if start >= end:
+            return b''
+        for block in range(self.block_at(start), self.block_at(end - 1) + 1):
+            offset = self.starts[block]
+            parts.append(self.decode_block(block)[max(start - offset, 0):end - offset])
+        return b''.join(parts)
+
+    def context(self, offset: int, length: int, lines: int = 0):
+        """
+        This function returns the start and the end of the lines
+        of a match of the given length, together with the given
+        number of lines before and after them.
+        """
+        start = self.rfind_newline(offset) + 1
+        for _ in range(lines):
+            if not start:
+                break
+            start = self.rfind_newline(start - 1) + 1
+        end = self.find_newline(offset + max(length - 1, 0))
+        for _ in range(lines):
+            if end >= self.original_length:
+                break
+            end = self.find_newline(end + 1)
+        return start, end
+
+
+class HuffmanArchiveWriter(HuffmanFileEncoder):
+    """
+    This class handles the encoding of many files into one
+    archive. A single code table is built over all members,
+    the members are encoded back to back and a central
+    directory of their names, offsets and lengths is appended.
+    """
+    def __init__(self, members, log=logging.getLogger(), chunk_size=CHUNK_SIZE):
+        super().__init__(None, 1, log, chunk_size)
+        self.members = members  # list of (name, path) tuples
+
+    def read_chunks(self):
+        """
+        This function yields the chunks of all members, so the
+        frequencies are counted over the whole archive.
+        """
+        for _, path in self.members:
+            yield from self.read_member_chunks(path)
+
+    def read_member_chunks(self, path):
+        """
+        This function yields the chunks of a single member.
+        """
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(self.chunk_size), b'')
+
+    def encode_archive(self, output):
+        """
+        This function encodes the members and writes the archive
+        to the binary output stream, which does not need to be
+        seekable.
+        """
+        self.log.info('Encoding archive...')
+        # the code table needs at least one character
+        if not any(os.path.getsize(path) for _, path in self.members):
+            self.log.error('The archive has no content, all members are empty.')
+            raise ValueError('The archive has no content, all members are empty.')
+        self.analyze_file()
+        self.build_tree()
+        self.build_codes()
+        self.encode_array()
+        header = ARCHIVE_HEADER.pack(
+            ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, ARCHIVE_HEADER.size
+        )
+        table = bitarray(self.encoded_array).tobytes()
+        output.write(header + table)
+        offset = len(header) + len(table)
+        codes = {ord(char): bitarray(code) for char, code in self.codes.items()}
+        directory = bytearray()
+        for name, path in self.members:
+            self.log.debug('Encoding member: %s', name)
+            bits = bitarray()
+            length = 0
+            original_length = 0
+            for chunk in self.read_member_chunks(path):
+                bits.encode(codes, chunk)
+                original_length += len(chunk)
+                # write all complete bytes and keep the remaining bits
+                complete = len(bits) - len(bits) % 8
+                output.write(bits[:complete].tobytes())
+                length += complete // 8
+                del bits[:complete]
+            output.write(bits.tobytes())  # every member ends on a byte
+            length += (len(bits) + 7) // 8
+            encoded_name = name.encode('utf-8')
+            directory += ARCHIVE_ENTRY.pack(
+                offset, length, original_length, len(encoded_name)
+            )
+            directory += encoded_name
+            offset += length
+        output.write(directory)
+        output.write(ARCHIVE_TRAILER.pack(offset, len(self.members), ARCHIVE_MAGIC))
+        self.log.info('Encoding finished.')
+
+
+class HuffmanArchiveReader(HuffmanDecoder):
+    """
+    This class handles the decoding of archives. The code table
+    and the central directory are read once, afterwards every
+    member is decoded on its own by seeking to its offset, so
+    members can be extracted one at a time or in parallel.
+    """
+    def __init__(self, path, log=logging.getLogger()):
+        super().__init__('', log)
+        self.path = path
+        self.version = FORMAT_VERSION  # the table has no padding bits
+        self.read_archive()
+
+    def __getstate__(self):
+        # the decode tree of bitarray can not be pickled, it is
+        # built again by the worker processes
+        state = self.__dict__.copy()
+        state.pop('decodetree', None)
+        return state
+
+    def read_archive(self):
+        """
+        This function reads the header, the code table and the
+        central directory of the archive.
+        """
+        self.log.info('Reading archive...')
+        with open(self.path, 'rb') as f:
+            head = f.read(ARCHIVE_HEADER.size + MAX_TABLE_SIZE)
+            if len(head) < ARCHIVE_HEADER.size or not head.startswith(ARCHIVE_MAGIC):
+                self.log.error('The file is not an archive.')
+                raise ValueError('The file is not an archive.')
+            _, version, _, header_length = ARCHIVE_HEADER.unpack_from(head)
+            if version != ARCHIVE_VERSION:
+                self.log.error('Unsupported archive version: %s', version)
+                raise ValueError(f'Unsupported archive version: {version}')
+            self.decode_payload_codes(memoryview(head)[header_length:])
+            self.decode_tree()
+            self.optimize_tree()
+            f.seek(0, 2)
+            size = f.tell()
+            if size < ARCHIVE_TRAILER.size:
+                self.log.error('The archive is truncated.')
+                raise ValueError('The archive is truncated.')
+            f.seek(size - ARCHIVE_TRAILER.size)
+            offset, number_of_members, magic = ARCHIVE_TRAILER.unpack(f.read())
+            if magic != ARCHIVE_MAGIC or offset > size - ARCHIVE_TRAILER.size:
+                self.log.error('The archive is truncated.')
+                raise ValueError('The archive is truncated.')
+            f.seek(offset)
+            directory = f.read(size - ARCHIVE_TRAILER.size - offset)
+        self.members = {}
+        position = 0
+        for _ in range(number_of_members):
+            offset, length, original_length, name_length = ARCHIVE_ENTRY.unpack_from(
+                directory, position
+            )
+            position += ARCHIVE_ENTRY.size
+            name = directory[position:position + name_length].decode('utf-8')
+            position += name_length
+            self.members[name] = (offset, length, original_length)
+        self.log.debug('Number of members: %s', len(self.members))
+
+    def read_member(self, name):
+        """
+        This function decodes a single member and returns
+        its bytes.
+        """
+        if name not in self.members:
+            self.log.error('Member not found: %s', name)
+            raise KeyError(f'Member not found: {name}')
+        if not hasattr(self, 'decodetree'):
+            self.build_decodetree()
+        offset, length, original_length = self.members[name]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            bits = bitarray()
+            bits.frombytes(f.read(length))
+        try:
+            decoded = np.fromiter(
+                bits.decode(self.decodetree), dtype=np.uint8, count=original_length
+            )
+        except ValueError:
+            self.log.error('The member %s is truncated.', name)
+            raise ValueError(f'The member {name} is truncated.')
+        return decoded.tobytes()
+
+    def extract(self, output_dir, names=None, workers=1):
+        """
+        This function decodes the members, or all members if
+        no names are given, and writes them below the output
+        directory. The members are decoded by the given number
+        of worker processes.
+        """
+        names = list(self.members) if names is None else names
+        self.log.info('Extracting %s members...', len(names))
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                contents = executor.map(self.read_member, names, chunksize=16)
+                for name, content in zip(names, contents):
+                    self.write_member(output_dir, name, content)
+        else:
+            for name in names:
+                self.write_member(output_dir, name, self.read_member(name))
+        self.log.info('Extraction finished.')
+
+    def write_member(self, output_dir, name, content):
+        """
+        This function writes a decoded member below the output
+        directory. Names that would leave the directory are
+        rejected.
+        """
+        root = os.path.abspath(output_dir)
+        path = os.path.abspath(os.path.join(output_dir, name))
+        if (
+            os.path.isabs(name) or path == root
+            or os.path.commonpath([root, path]) != root
+        ):
+            self.log.error('Invalid member name: %s', name)
+            raise ValueError(f'Invalid member name: {name}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
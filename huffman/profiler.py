@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import random
+import tracemalloc
+
+from huffman.core import HuffmanEncoder, HuffmanDecoder
+
+
+# stages of HuffmanEncoder.encode and HuffmanDecoder.decode
+ENCODER_STAGES = [
+    'analyze_string',
+    'build_tree',
+    'build_codes',
+    'encode_array',
+    'encode_string',
+    'finalize_encoding',
+]
+DECODER_STAGES = [
+    'decode_header',
+    'decode_array',
+    'decode_payload_codes',
+    'decode_tree',
+    'optimize_tree',
+    'decode_data',
+    'decode_data_table',
+]
+# input sizes in bytes that are profiled by default
+SIZES = [10_000, 100_000, 1_000_000]
+WORDS = (
+    'the of and to in is that it was for on are as with his they at be this '
+    'from have or by one had not but what all were when we there can an your '
+    'which their said if do will each about how up out them then she many some '
+    'huffman tree code table stream chunk header decoder encoder compression'
+).split()
+
+
+class StageProfiler:
+    """
+    This class measures the memory that is allocated by the
+    stages of an encoder or decoder with tracemalloc. Every
+    stage is wrapped, so that its peak memory and the memory
+    it retains after returning are recorded in bytes.
+    """
+    def __init__(self, instance, stages):
+        self.instance = instance
+        self.stages = stages
+        self.results = {}
+
+    def wrap_stage(self, stage):
+        """
+        This function replaces the stage of the instance by a
+        wrapper that records its memory usage.
+        """
+        method = getattr(self.instance, stage)
+
+        def wrapper(*args, **kwargs):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = method(*args, **kwargs)
+            current, peak = tracemalloc.get_traced_memory()
+            self.results[stage] = {
+                'peak': peak - before,
+                'retained': current - before,
+            }
+            return result
+
+        setattr(self.instance, stage, wrapper)
+
+    def profile(self, function):
+        """
+        This function runs the function with all stages wrapped
+        and returns the results of the stages that were run.
+        """
+        for stage in self.stages:
+            if hasattr(self.instance, stage):
+                self.wrap_stage(stage)
+        tracemalloc.start()
+        try:
+            function()
+        finally:
+            tracemalloc.stop()
+        return self.results
+
+
+def sample_text(size, seed=0):
+    """
+    This function generates English-like ASCII text of the
+    given size in bytes.
+    """
+    generator = random.Random(seed)
+    words = generator.choices(WORDS, k=size // 4 + 1)
+    lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return '\n'.join(lines)[:size]
+
+
+def profile_encoder(string, level=1):
+    """
+    This function profiles the stages of HuffmanEncoder.encode.
+    """
+    encoder = HuffmanEncoder(string, level, logging.getLogger('profiler'))
+    return StageProfiler(encoder, ENCODER_STAGES).profile(encoder.encode)
+
+
+def profile_decoder(data, engine='table'):
+    """
+    This function profiles the stages of HuffmanDecoder.decode
+    for encoded bytes or a legacy binary string.
+    """
+    decoder = HuffmanDecoder(data, logging.getLogger('profiler'), engine)
+    return StageProfiler(decoder, DECODER_STAGES).profile(decoder.decode)
+
+
+def report(sizes=SIZES):
+    """
+    This function profiles the encoder and both engines of the
+    decoder for inputs of the given sizes and returns the peak
+    and retained memory of every stage in bytes per input byte.
+    """
+    rows = []
+    for size in sizes:
+        string = sample_text(size)
+        data = HuffmanEncoder(string, 1).encode_bytes()
+        results = [('encoder', profile_encoder(string))]
+        for engine in ['table', 'tree']:
+            results.append((f'decoder ({engine})', profile_decoder(data, engine)))
+        for component, stages in results:
+            for stage, memory in stages.items():
+                rows.append({
+                    'size': size,
+                    'component': component,
+                    'stage': stage,
+                    'peak': memory['peak'] / size,
+                    'retained': memory['retained'] / size,
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Report the memory usage of the encoder and decoder stages'
+    )
+    parser.add_argument(
+        'sizes',
+        nargs='*',
+        type=int,
+        help='input sizes in bytes',
+        default=SIZES,
+    )
+    parser.add_argument(
+        '--json',
+        help='print the report as JSON',
+        action='store_true'
+    )
+    args = parser.parse_args()
+    rows = report(args.sizes)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(
+        f'{"size":>10}  {"component":<16}  {"stage":<22}  '
+        f'{"peak B/B":>9}  {"retained B/B":>12}'
+    )
+    for row in rows:
+        print(
+            f'{row["size"]:>10}  {row["component"]:<16}  {row["stage"]:<22}  '
+            f'{row["peak"]:>9.2f}  {row["retained"]:>12.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 import os
 import subprocess
 import difflib
+import json
 
 # main test function for funtionality
 def run_test(file):
@@ -50,7 +51,178 @@ def run_test(file):
         raise ValueError(f'Original and decoded files {file} are not the same!')
 
 
+# test for piping the file through compression and decompression
+def run_pipe_test(file):
+    with open('test/' + file, 'rb') as f:
+        original = f.read()
+    encoded = subprocess.run(
+        ['python3', 'huffman'], input=original, stdout=subprocess.PIPE
+    ).stdout
+    if not encoded.startswith(b'\x89HUF'):
+        raise ValueError(f'Encoded stream of {file} has no magic number!')
+    decoded = subprocess.run(
+        ['python3', 'huffman'], input=encoded, stdout=subprocess.PIPE
+    ).stdout
+    if original != decoded:
+        raise ValueError(f'Original and piped files {file} are not the same!')
+
+
+# test for piping a stream of the legacy format without magic number
+def run_legacy_pipe_test(file):
+    with open('test/' + file, 'r') as f:
+        original = f.read()
+    encoded = subprocess.run(
+        ['python3', '-c', (
+            'import sys; from bitarray import bitarray; '
+            'from huffman.core import HuffmanEncoder; '
+            'bits = bitarray(HuffmanEncoder(sys.stdin.read(), 1).encode()); '
+            'sys.stdout.buffer.write(bits.tobytes())'
+        )],
+        input=original.encode(), stdout=subprocess.PIPE
+    ).stdout
+    decoded = subprocess.run(
+        ['python3', 'huffman'], input=encoded, stdout=subprocess.PIPE
+    ).stdout
+    if original.encode() != decoded:
+        raise ValueError(f'Original and piped legacy files {file} are not the same!')
+
+
+# test for appending a file to an encoded file
+def run_append_test(first, second):
+    with open('test/' + first, 'rb') as f:
+        original = f.read()
+    with open('test/' + second, 'rb') as f:
+        original += f.read()
+    subprocess.call(['python3', 'huffman', 'test/' + first, '-o', 'test/appended.huff'])
+    subprocess.call(
+        ['python3', 'huffman', 'test/' + second, '-o', 'test/appended.huff',
+         '-a', '-l', '4']
+    )
+    decoded = subprocess.run(
+        ['python3', 'huffman', 'test/appended.huff'], stdout=subprocess.PIPE
+    ).stdout
+    os.remove('test/appended.huff')
+    if original != decoded:
+        raise ValueError(f'Appended files {first} and {second} are not the same!')
+    # standard output cannot be appended to
+    result = subprocess.run(
+        ['python3', 'huffman', 'test/' + first, '-a'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode == 0 or result.stdout:
+        raise ValueError('Appending to standard output was not rejected!')
+
+
+# test that a failed append keeps the encoded file and that a failed
+# compression leaves no output file
+def run_append_failure_test(file):
+    subprocess.call(['python3', 'huffman', 'test/' + file, '-o', 'test/appended.huff'])
+    with open('test/appended.huff', 'rb') as f:
+        encoded = f.read()
+    # the non-ASCII character is not part of the sample, so it is
+    # found while the member is written
+    with open('test/invalid.txt', 'wb') as f:
+        f.write(b'a' * 300000 + '–'.encode() + b'a' * 300000)
+    result = subprocess.run(
+        ['python3', 'huffman', 'test/invalid.txt', '-o', 'test/appended.huff', '-a',
+         '--fast-stats', '2'],
+        stderr=subprocess.PIPE
+    )
+    with open('test/appended.huff', 'rb') as f:
+        appended = f.read()
+    # a new output file is removed
+    subprocess.run(
+        ['python3', 'huffman', 'test/invalid.txt', '-o', 'test/invalid.huff',
+         '--fast-stats', '2'],
+        stderr=subprocess.PIPE
+    )
+    removed = not os.path.exists('test/invalid.huff')
+    os.remove('test/invalid.txt')
+    os.remove('test/appended.huff')
+    if result.returncode == 0:
+        raise ValueError('Appending a non-ASCII file did not fail!')
+    if appended != encoded:
+        raise ValueError(f'Failed append changed the encoded file {file}!')
+    if not removed:
+        os.remove('test/invalid.huff')
+        raise ValueError('Failed compression left a partial output file!')
+
+
+# test for estimating the character counts from a sample
+def run_fast_stats_test(file):
+    with open('test/' + file, 'rb') as f:
+        original = f.read()
+    # the input is larger than two sample chunks of 64 KiB and ends
+    # with a character that is not part of the sample
+    original = original * (2 * (1 << 16) // len(original) + 2) + b'\x7f'
+    for level in ['1', '4']:
+        result = subprocess.run(
+            ['python3', 'huffman', '-l', level, '--fast-stats', '2', '-v'],
+            input=original, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if b'Estimating counts from 2 chunks' not in result.stderr:
+            raise ValueError(f'Counts of {file} were not estimated at level {level}!')
+        decoded = subprocess.run(
+            ['python3', 'huffman'], input=result.stdout, stdout=subprocess.PIPE
+        ).stdout
+        if original != decoded:
+            raise ValueError(f'Original and sampled files {file} are not the same!')
+
+
+# test for packing files into an archive and unpacking it again
+def run_pack_test(files):
+    os.makedirs('test/pack_input')
+    for file in files:
+        with open('test/' + file, 'rb') as f:
+            original = f.read()
+        with open('test/pack_input/' + file, 'wb') as f:
+            f.write(original)
+    subprocess.call(
+        ['python3', 'huffman', 'pack', 'test/pack_input', '-o', 'test/packed.huffa']
+    )
+    subprocess.call(
+        ['python3', 'huffman', 'unpack', 'test/packed.huffa', '-o', 'test/pack_output']
+    )
+    for file in files:
+        with open('test/' + file, 'rb') as f:
+            original = f.read()
+        with open('test/pack_output/' + file, 'rb') as f:
+            unpacked = f.read()
+        if original != unpacked:
+            raise ValueError(f'Original and unpacked files {file} are not the same!')
+    for directory in ['test/pack_input', 'test/pack_output']:
+        for file in files:
+            os.remove(f'{directory}/{file}')
+        os.rmdir(directory)
+    os.remove('test/packed.huffa')
+
+
+# test that the benchmark reports every codec
+def run_bench_test(file):
+    output = subprocess.run(
+        ['python3', 'huffman', 'bench', 'test/' + file, '--json'], stdout=subprocess.PIPE
+    ).stdout
+    results = json.loads(output)
+    codecs = [result['codec'] for result in results]
+    expected = [
+        'huffman level 1 (table)', 'huffman level 1 (tree)', 'zlib', 'bz2', 'lzma'
+    ]
+    for codec in expected:
+        if codec not in codecs:
+            raise ValueError(f'Benchmark of {file} is missing {codec}!')
+    if any('error' in result for result in results):
+        raise ValueError(f'Benchmark of {file} failed!')
+
+
 # run tests
 run_test('short.txt')
 run_test('medium.txt')
 run_test('long.txt')
+run_pipe_test('short.txt')
+run_pipe_test('long.txt')
+run_legacy_pipe_test('medium.txt')
+run_bench_test('short.txt')
+run_append_test('short.txt', 'medium.txt')
+run_append_failure_test('medium.txt')
+run_pack_test(['short.txt', 'medium.txt'])
+run_fast_stats_test('long.txt')
@@ -1,7 +1,20 @@
 from unittest import TestCase
 import heapq
+import io
+import os
+import tempfile
+from bitarray import bitarray
 
-from huffman.core import HuffmanNode, HuffmanEncoder, HuffmanDecoder
+from huffman.core import (
+    HEADER, MAGIC, FORMAT_VERSION, FLAG_INDEX, INDEX_INTERVAL, INDEX_TRAILER,
+    MAX_CONTEXT_CODE_LENGTH, CONTEXT_SLICE_SIZE, TANS_TABLE_LOG, TANS_BLOCK_SIZE,
+    HuffmanNode, HuffmanEncoder, HuffmanFileEncoder, ContextHuffmanEncoder, TansEncoder,
+    HuffmanDecoder, HuffmanStreamDecoder, HuffmanSearcher, HuffmanArchiveWriter,
+    HuffmanArchiveReader, canonical_codes,
+)
+
+
+TEST_DIR = os.path.dirname(__file__)
 
 
 class TestHuffmanEncoder(TestCase):
@@ -85,6 +98,14 @@ class TestHuffmanEncoder(TestCase):
         # code: 000  # this is the code for 'A' padded with 0s
         # unicode: 01000001  # this is the unicode for 'A' in binary (8 bits) 
 
+    def test_encode_array_all_characters(self):
+        # 128 codes are written as 0 codes
+        string = ''.join(chr(i) for i in range(128)) * 2 + 'a'
+        encoder = HuffmanEncoder(string, 1)
+        self.assertEqual(encoder.encode()[3:10], '0000000')
+        self.assertEqual(HuffmanDecoder(encoder.encode()).decode(), string)
+        self.assertEqual(HuffmanDecoder(encoder.encode_bytes()).decode(), string)
+
     def test_encode_string(self):
         string = 'ABRAKADABRA'
         encoder = HuffmanEncoder(string, 1)
@@ -95,6 +116,262 @@ class TestHuffmanEncoder(TestCase):
         self.assertEqual(encoder.encoded_string, '01111100100010101111100')
 
 
+class TestHuffmanFileEncoder(TestCase):
+    def encode_file(self, file, chunk_size):
+        path = os.path.join(TEST_DIR, file)
+        encoder = HuffmanFileEncoder(path, 1, chunk_size=chunk_size)
+        output = io.BytesIO()
+        encoder.encode_file(output)
+        return output.getvalue()
+
+    def test_encode_file(self):
+        for file in ['short.txt', 'sentence.txt', 'medium.txt', 'long.txt']:
+            with open(os.path.join(TEST_DIR, file), 'r') as f:
+                string = f.read()
+            # the chunked output must be identical to the in-memory output
+            # without the three padding bits at its start
+            expected = bitarray(HuffmanEncoder(string, 1).encode()[3:]).tobytes()
+            expected = HEADER.pack(
+                MAGIC, FORMAT_VERSION, FLAG_INDEX, 1, HEADER.size, len(string)
+            ) + expected
+            for chunk_size in [64, 7]:
+                data = self.encode_file(file, chunk_size)
+                # the encoded data is followed by the index
+                self.assertEqual(data[:len(expected)], expected)
+                _, _, position = HuffmanDecoder(data).decode_index(data)
+                self.assertEqual(position, len(expected))
+
+    def test_encode_index(self):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            string = f.read() * 30
+        data = HuffmanEncoder(string, 1).encode_bytes()
+        checkpoints, interval, _ = HuffmanDecoder(data).decode_index(data)
+        self.assertEqual(interval, INDEX_INTERVAL)
+        self.assertEqual(len(checkpoints), -(-len(string) // INDEX_INTERVAL))
+        self.assertEqual(checkpoints[0], 0)
+        self.assertEqual(data[-INDEX_TRAILER.size:][8:16], len(data).to_bytes(8, 'big'))
+
+    def test_encode_file_round_trip(self):
+        data = self.encode_file('medium.txt', 100)
+        with open(os.path.join(TEST_DIR, 'medium.txt'), 'r') as f:
+            original = f.read()
+        self.assertEqual(HuffmanDecoder(data).decode(), original)
+        self.assertEqual(HuffmanDecoder(data, engine='tree').decode(), original)
+
+    def test_encode_file_single_character(self):
+        output = io.BytesIO()
+        encoder = HuffmanFileEncoder(None, 1)
+        encoder.read_chunks = lambda: iter([b'aaa', b'aa'])
+        encoder.encode_file(output)
+        self.assertEqual(HuffmanDecoder(output.getvalue()).decode(), 'aaaaa')
+
+    def test_encode_file_sampled(self):
+        # the characters at the end are not part of the sample
+        string = ('a' * 1000 + 'b' * 500) * 10 + '\x00~Z\x7f'
+        output = io.BytesIO()
+        encoder = HuffmanFileEncoder(
+            io.BytesIO(string.encode()), 1, chunk_size=64, sample_chunks=4
+        )
+        encoder.encode_file(output)
+        data = output.getvalue()
+        self.assertEqual(len(encoder.frequencies), 128)
+        self.assertGreaterEqual(encoder.ratio_loss, 0)
+        self.assertEqual(HuffmanDecoder(data).decode(), string)
+        self.assertEqual(HuffmanDecoder(data, engine='tree').decode(), string)
+        stream = io.BytesIO()
+        chunks = [data[i:i+9] for i in range(0, len(data), 9)]
+        HuffmanStreamDecoder(chunks).decode_to(stream)
+        self.assertEqual(stream.getvalue(), string.encode())
+
+    def test_encode_file_sampled_small(self):
+        # files that are not larger than the sample are counted exactly
+        data = self.encode_file('medium.txt', 100)
+        output = io.BytesIO()
+        encoder = HuffmanFileEncoder(
+            os.path.join(TEST_DIR, 'medium.txt'), 1, chunk_size=100, sample_chunks=1000
+        )
+        encoder.encode_file(output)
+        self.assertEqual(output.getvalue(), data)
+        self.assertIsNone(encoder.ratio_loss)
+
+    def test_encode_file_sampled_non_ascii(self):
+        encoder = HuffmanFileEncoder(
+            io.BytesIO(b'a' * 1000 + '–'.encode() + b'a' * 1000), 1,
+            chunk_size=64, sample_chunks=2
+        )
+        with self.assertRaisesRegex(ValueError, 'non-ASCII'):
+            encoder.encode_file(io.BytesIO())
+
+    def test_optimal_length(self):
+        encoder = HuffmanFileEncoder(None, 1)
+        # codes of 1, 2 and 2 bits
+        self.assertEqual(encoder.optimal_length([5, 0, 2, 2]), 5 + 2 * 2 + 2 * 2)
+        self.assertEqual(encoder.optimal_length([0, 7]), 7)
+
+
+class TestContextHuffmanEncoder(TestCase):
+    def test_canonical_codes(self):
+        codes = canonical_codes({'A': 1, 'B': 3, 'R': 3, 'K': 3, 'D': 3})
+        self.assertEqual(
+            {char: code.to01() for char, code in codes.items()},
+            {'A': '0', 'B': '100', 'D': '101', 'K': '110', 'R': '111'}
+        )
+
+    def test_code_lengths(self):
+        encoder = ContextHuffmanEncoder(None, 3)
+        self.assertEqual(encoder.code_lengths({65: 5}), {65: 1})
+        # fibonacci frequencies result in the longest possible codes
+        fibonacci = [1, 1]
+        while len(fibonacci) < 30:
+            fibonacci.append(fibonacci[-1] + fibonacci[-2])
+        lengths = encoder.code_lengths(dict(enumerate(fibonacci)))
+        self.assertLessEqual(max(lengths.values()), MAX_CONTEXT_CODE_LENGTH)
+        self.assertEqual(sum(2 ** -length for length in lengths.values()), 1)
+
+    def test_encode_bytes_round_trip(self):
+        for file in ['short.txt', 'sentence.txt', 'medium.txt', 'long.txt']:
+            with open(os.path.join(TEST_DIR, file), 'r') as f:
+                string = f.read()
+            data = HuffmanEncoder(string, 3).encode_bytes()
+            self.assertEqual(HuffmanDecoder(data).decode(), string)
+            chunks = [data[i:i+9] for i in range(0, len(data), 9)]
+            output = io.BytesIO()
+            HuffmanStreamDecoder(chunks).decode_to(output)
+            self.assertEqual(output.getvalue(), string.encode())
+        data = HuffmanEncoder('aaaa', 3).encode_bytes()
+        self.assertEqual(HuffmanDecoder(data).decode(), 'aaaa')
+
+    def test_decode_slices(self):
+        # the runs are decoded from slices of the data
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            string = f.read() * 100
+        data = HuffmanEncoder(string, 3).encode_bytes()
+        self.assertGreater(len(data), CONTEXT_SLICE_SIZE)
+        self.assertEqual(HuffmanDecoder(data).decode(), string)
+        for size in [1000, 70000]:
+            chunks = [data[i:i+size] for i in range(0, len(data), size)]
+            output = io.BytesIO()
+            HuffmanStreamDecoder(chunks).decode_to(output)
+            self.assertEqual(output.getvalue(), string.encode())
+
+    def test_encode_bytes_ratio(self):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            string = f.read()
+        level_1 = HuffmanEncoder(string, 1).encode_bytes()
+        level_3 = HuffmanEncoder(string, 3).encode_bytes()
+        self.assertLess(len(level_3), len(level_1) * 0.95)
+
+    def test_decode_truncated(self):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            data = HuffmanEncoder(f.read(), 3).encode_bytes()
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            HuffmanDecoder(data[:HEADER.size + 20]).decode()
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            HuffmanDecoder(data[:-50]).decode()
+
+
+class TestTansEncoder(TestCase):
+    def test_normalize_counts(self):
+        encoder = TansEncoder(None, 4)
+        encoder.frequencies = {'a': 100000, 'b': 10, 'c': 1}
+        encoder.normalize_counts()
+        self.assertEqual(sum(encoder.counts.values()), 1 << TANS_TABLE_LOG)
+        self.assertEqual(encoder.counts[ord('c')], 1)
+        self.assertGreater(encoder.counts[ord('a')], encoder.counts[ord('b')])
+
+    def test_encode_bytes_round_trip(self):
+        for file in ['short.txt', 'sentence.txt', 'medium.txt', 'long.txt']:
+            with open(os.path.join(TEST_DIR, file), 'r') as f:
+                string = f.read()
+            data = HuffmanEncoder(string, 4).encode_bytes()
+            self.assertEqual(HuffmanDecoder(data).decode(), string)
+            chunks = [data[i:i+9] for i in range(0, len(data), 9)]
+            output = io.BytesIO()
+            HuffmanStreamDecoder(chunks).decode_to(output)
+            self.assertEqual(output.getvalue(), string.encode())
+        data = HuffmanEncoder('aaaa', 4).encode_bytes()
+        self.assertEqual(HuffmanDecoder(data).decode(), 'aaaa')
+
+    def test_encode_file_sampled(self):
+        string = ('a' * 1000 + 'b' * 500) * 10 + '\x00~Z\x7f'
+        output = io.BytesIO()
+        encoder = TansEncoder(
+            io.BytesIO(string.encode()), 4, chunk_size=64, sample_chunks=4
+        )
+        encoder.encode_file(output)
+        self.assertEqual(len(encoder.counts), 128)
+        self.assertGreaterEqual(encoder.ratio_loss, 0)
+        self.assertEqual(HuffmanDecoder(output.getvalue()).decode(), string)
+
+    def test_encode_file_sampled_single_character(self):
+        string = 'a' * 100
+        encoder = TansEncoder(
+            io.BytesIO(string.encode()), 4, chunk_size=16, sample_chunks=2
+        )
+        output = io.BytesIO()
+        encoder.encode_file(output)
+        self.assertTrue(0 < encoder.ratio_loss < float('inf'))
+        self.assertEqual(HuffmanDecoder(output.getvalue()).decode(), string)
+
+    def test_encode_blocks(self):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            string = f.read() * 30
+        self.assertGreater(len(string), TANS_BLOCK_SIZE)
+        data = HuffmanEncoder(string, 4).encode_bytes()
+        self.assertEqual(HuffmanDecoder(data).decode(), string)
+
+    def test_encode_bytes_ratio(self):
+        # one character with a probability above one half takes up
+        # a whole bit with Huffman codes
+        string = ''.join(
+            ' ' * 9 + 'ab\n' if i % 3 else ' ' * 12 + 'x\n' for i in range(3000)
+        )
+        level_1 = HuffmanEncoder(string, 1).encode_bytes()
+        level_4 = HuffmanEncoder(string, 4).encode_bytes()
+        self.assertLess(len(level_4), len(level_1) * 0.85)
+
+    def test_decode_truncated(self):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            data = HuffmanEncoder(f.read(), 4).encode_bytes()
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            HuffmanDecoder(data[:HEADER.size + 20]).decode()
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            HuffmanDecoder(data[:-50]).decode()
+
+
+class TestHuffmanStreamDecoder(TestCase):
+    def decode_stream(self, data, chunk_size):
+        chunks = [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+        output = io.BytesIO()
+        HuffmanStreamDecoder(chunks).decode_to(output)
+        return output.getvalue()
+
+    def test_decode_to(self):
+        for file in ['short.txt', 'sentence.txt', 'medium.txt', 'long.txt']:
+            output = io.BytesIO()
+            HuffmanFileEncoder(os.path.join(TEST_DIR, file), 1).encode_file(output)
+            with open(os.path.join(TEST_DIR, file), 'rb') as f:
+                original = f.read()
+            self.assertEqual(self.decode_stream(output.getvalue(), 5), original)
+            self.assertEqual(self.decode_stream(output.getvalue(), 4096), original)
+
+    def test_decode_to_without_magic(self):
+        data = bitarray(HuffmanEncoder('ABRAKADABRA', 1).encode()).tobytes()
+        self.assertEqual(self.decode_stream(data, 3), b'ABRAKADABRA')
+        # version 1 consists of the magic number and the legacy format
+        data = MAGIC + b'\x01' + data
+        self.assertEqual(self.decode_stream(data, 3), b'ABRAKADABRA')
+
+    def test_decode_to_truncated(self):
+        output = io.BytesIO()
+        HuffmanFileEncoder(os.path.join(TEST_DIR, 'medium.txt'), 1).encode_file(output)
+        data = output.getvalue()
+        # the index at the end is not needed for decoding
+        _, _, position = HuffmanDecoder(data).decode_index(data)
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            self.decode_stream(data[:position - 20], 64)
+
+
 class TestHuffmanDecoder(TestCase):
     def test_read_until(self):
         string = '111111001010100'
@@ -120,7 +397,8 @@ class TestHuffmanDecoder(TestCase):
 
     def test_decode_array(self):
         decoder = HuffmanDecoder(
-            '101000010111100001000001100010010111010100010011001010010111010000100111110010001010111110000000',
+            '10100001011110000100000110001001011101010001001100101001'
+            '0111010000100111110010001010111110000000',
         )
         decoder.decode_array()
         self.assertEqual(
@@ -136,7 +414,8 @@ class TestHuffmanDecoder(TestCase):
 
     def test_decode_tree(self):
         decoder = HuffmanDecoder(
-            '101000010111100001000001100010010111010100010011001010010111010000100111110010001010111110000000',
+            '10100001011110000100000110001001011101010001001100101001'
+            '0111010000100111110010001010111110000000',
         )
         decoder.decode_array()
         decoder.decode_tree()
@@ -177,7 +456,8 @@ class TestHuffmanDecoder(TestCase):
 
     def test_optimize_tree(self):
         decoder = HuffmanDecoder(
-            '101000010111100001000001100010010111010100010011001010010111010000100111110010001010111110000000',
+            '10100001011110000100000110001001011101010001001100101001'
+            '0111010000100111110010001010111110000000',
         )
         decoder.decode_array()
         decoder.decode_tree()
@@ -209,10 +489,206 @@ class TestHuffmanDecoder(TestCase):
 
     def test_decode_data(self):
         decoder = HuffmanDecoder(
-            '101000010111100001000001100010010111010100010011001010010111010000100111110010001010111110000000',
+            '10100001011110000100000110001001011101010001001100101001'
+            '0111010000100111110010001010111110000000',
         )
         decoder.decode_array()
         decoder.decode_tree()
         decoder.optimize_tree()
         decoder.decode_data()
         self.assertEqual(decoder.decoded_string, 'ABRAKADABRA')
+
+    def test_decode_bytes(self):
+        legacy = bitarray(HuffmanEncoder('ABRAKADABRA', 1).encode()).tobytes()
+        for data in [legacy, MAGIC + b'\x01' + legacy]:
+            for engine in ['table', 'tree']:
+                decoder = HuffmanDecoder(data, engine=engine)
+                self.assertEqual(decoder.decode(), 'ABRAKADABRA')
+
+    def test_decode_header(self):
+        output = io.BytesIO()
+        HuffmanFileEncoder(os.path.join(TEST_DIR, 'long.txt'), 1).encode_file(output)
+        data = output.getvalue()
+        decoder = HuffmanDecoder(data)
+        self.assertEqual(decoder.decode_header(data), HEADER.size)
+        self.assertEqual(decoder.version, FORMAT_VERSION)
+        self.assertEqual(decoder.level, 1)
+        size = os.path.getsize(os.path.join(TEST_DIR, 'long.txt'))
+        self.assertEqual(decoder.original_length, size)
+        with self.assertRaisesRegex(ValueError, 'truncated'):
+            HuffmanDecoder(data[:len(data) // 2]).decode()
+        with self.assertRaisesRegex(ValueError, 'Unsupported format version'):
+            HuffmanDecoder(MAGIC + b'\x09' + data[5:]).decode()
+
+
+class TestHuffmanSearcher(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(TEST_DIR, 'long.txt'), 'r') as f:
+            # the text spans several blocks of the index
+            cls.string = f.read() * 30 + 'a needle in the last block\n'
+        cls.data = HuffmanEncoder(cls.string, 1).encode_bytes()
+
+    def expected(self, pattern):
+        return [i for i in range(len(self.string)) if self.string.startswith(pattern, i)]
+
+    def test_search(self):
+        searcher = HuffmanSearcher(self.data)
+        patterns = ['rubber ducks', 'Faust', 'the', 'e', '.\n', 'not in the text', '~']
+        for pattern in patterns:
+            with self.subTest(pattern=pattern):
+                self.assertEqual(
+                    searcher.search(pattern.encode('ascii')), self.expected(pattern)
+                )
+        # only the blocks with candidates are decoded
+        searcher = HuffmanSearcher(self.data)
+        self.assertEqual(searcher.search(b'needle'), self.expected('needle'))
+        self.assertEqual(list(searcher.blocks), [searcher.number_of_blocks() - 1])
+
+    def test_search_dense(self):
+        # candidates in most blocks are searched in the decoded blocks
+        searcher = HuffmanSearcher(self.data)
+        self.assertEqual(searcher.search(b'Faust'), self.expected('Faust'))
+        self.assertEqual(len(searcher.blocks), searcher.number_of_blocks())
+
+    def test_search_without_index(self):
+        data = HuffmanEncoder(self.string, 3).encode_bytes()
+        self.assertEqual(HuffmanSearcher(data).search(b'Faust'), self.expected('Faust'))
+
+    def test_search_not_encoded(self):
+        with self.assertRaisesRegex(ValueError, 'not an encoded file'):
+            HuffmanSearcher(self.string.encode('ascii'))
+        with self.assertRaisesRegex(ValueError, 'not an encoded file'):
+            HuffmanSearcher(HuffmanEncoder(self.string, 1).encode_bytes()[HEADER.size:])
+
+    def test_context(self):
+        searcher = HuffmanSearcher(self.data)
+        lines = self.string.splitlines()
+        offset = searcher.search(b'Faust')[-1]
+        start, end = searcher.context(offset, len('Faust'))
+        line = searcher.decode_range(start, end).decode('ascii')
+        self.assertIn('Faust', line)
+        self.assertIn(line, lines)
+        start, end = searcher.context(offset, len('Faust'), 1)
+        self.assertEqual(searcher.decode_range(start, end).decode('ascii').count('\n'), 2)
+        self.assertEqual(searcher.context(0, 1), (0, self.string.index('\n')))
+
+
+class TestAppendedMembers(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.strings = []
+        for file in ['long.txt', 'sentence.txt', 'medium.txt']:
+            with open(os.path.join(TEST_DIR, file), 'r') as f:
+                cls.strings.append(f.read())
+
+    def encode(self, levels):
+        return b''.join(
+            HuffmanEncoder(string, level).encode_bytes()
+            for string, level in zip(self.strings, levels)
+        )
+
+    def test_decode(self):
+        for levels in [(1, 1, 1), (1, 3, 4), (4, 1, 3)]:
+            data = self.encode(levels)
+            with self.subTest(levels=levels):
+                string = ''.join(self.strings)
+                self.assertEqual(HuffmanDecoder(data).decode(), string)
+                self.assertEqual(HuffmanDecoder(data, engine='tree').decode(), string)
+                for chunk_size in [7, 1000]:
+                    chunks = [
+                        data[i:i+chunk_size] for i in range(0, len(data), chunk_size)
+                    ]
+                    output = io.BytesIO()
+                    HuffmanStreamDecoder(chunks).decode_to(output)
+                    self.assertEqual(output.getvalue(), string.encode())
+
+    def test_decode_trailing_bytes(self):
+        data = self.encode((1, 4)) + b'trailing bytes'
+        self.assertEqual(HuffmanDecoder(data).decode(), ''.join(self.strings[:2]))
+
+    def test_search(self):
+        data = self.encode((1, 1, 1))
+        searcher = HuffmanSearcher(data)
+        self.assertEqual(len(searcher.members), 3)
+        string = ''.join(self.strings)
+        # the pattern reaches from the first into the second member
+        pattern = string[len(self.strings[0]) - 4:len(self.strings[0]) + 6]
+        for pattern in [pattern, 'the', 'rubber ducks']:
+            expected = [i for i in range(len(string)) if string.startswith(pattern, i)]
+            self.assertEqual(searcher.search(pattern.encode('ascii')), expected)
+
+    def test_search_without_index(self):
+        searcher = HuffmanSearcher(self.encode((1, 3)))
+        self.assertEqual(searcher.members, [])
+        string = ''.join(self.strings[:2])
+        expected = [i for i in range(len(string)) if string.startswith('the', i)]
+        self.assertEqual(searcher.search(b'the'), expected)
+
+
+class TestHuffmanArchive(TestCase):
+    FILES = ['short.txt', 'sentence.txt', 'medium.txt', 'long.txt']
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.huffa')
+        members = [(file, os.path.join(TEST_DIR, file)) for file in self.FILES]
+        with open(self.path, 'wb') as f:
+            HuffmanArchiveWriter(members, chunk_size=100).encode_archive(f)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_member(self):
+        reader = HuffmanArchiveReader(self.path)
+        self.assertEqual(list(reader.members), self.FILES)
+        for file in reversed(self.FILES):
+            with open(os.path.join(TEST_DIR, file), 'rb') as f:
+                self.assertEqual(reader.read_member(file), f.read())
+        with self.assertRaises(KeyError):
+            reader.read_member('missing.txt')
+
+    def test_extract(self):
+        output_dir = os.path.join(self.directory.name, 'output')
+        HuffmanArchiveReader(self.path).extract(output_dir, workers=2)
+        for file in self.FILES:
+            with open(os.path.join(TEST_DIR, file), 'rb') as f:
+                with open(os.path.join(output_dir, file), 'rb') as g:
+                    self.assertEqual(g.read(), f.read())
+
+    def test_shared_code_table(self):
+        size = 0
+        for file in self.FILES:
+            output = io.BytesIO()
+            HuffmanFileEncoder(os.path.join(TEST_DIR, file), 1).encode_file(output)
+            size += len(output.getvalue())
+        self.assertLess(os.path.getsize(self.path), size)
+
+    def test_extract_current_directory(self):
+        output_dir = os.path.join(self.directory.name, 'output')
+        os.makedirs(output_dir)
+        cwd = os.getcwd()
+        os.chdir(output_dir)
+        try:
+            HuffmanArchiveReader(self.path).extract('.')
+        finally:
+            os.chdir(cwd)
+        for file in self.FILES:
+            with open(os.path.join(TEST_DIR, file), 'rb') as f:
+                with open(os.path.join(output_dir, file), 'rb') as g:
+                    self.assertEqual(g.read(), f.read())
+
+    def test_write_member_outside(self):
+        reader = HuffmanArchiveReader(self.path)
+        with self.assertRaisesRegex(ValueError, 'Invalid member name'):
+            reader.write_member(self.directory.name, '../escape.txt', b'')
+
+    def test_empty_members(self):
+        path = os.path.join(self.directory.name, 'empty.txt')
+        open(path, 'wb').close()
+        with self.assertRaisesRegex(ValueError, 'all members are empty'):
+            HuffmanArchiveWriter([('empty.txt', path)]).encode_archive(io.BytesIO())
+
+    def test_not_an_archive(self):
+        with self.assertRaisesRegex(ValueError, 'not an archive'):
+            HuffmanArchiveReader(os.path.join(TEST_DIR, 'short.txt'))
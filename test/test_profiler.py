@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from huffman.core import HuffmanEncoder
+from huffman.profiler import (
+    StageProfiler, profile_encoder, profile_decoder, sample_text,
+)
+
+
+SIZE = 200_000
+# Peak memory budget of every stage in bytes per input byte. The
+# sample text is encoded with about 4 bits per character, so the
+# binary strings of the encoder take up about 4 bytes per input byte.
+ENCODER_BUDGETS = {
+    'analyze_string': 0.25,
+    'build_tree': 0.25,
+    'build_codes': 0.25,
+    'encode_array': 0.25,
+    'encode_string': 9,
+    'finalize_encoding': 4.5,
+}
+DECODER_BUDGETS = {
+    'decode_header': 0.25,
+    'decode_array': 4.5,
+    'decode_payload_codes': 1,
+    'decode_tree': 0.25,
+    'optimize_tree': 0.25,
+    'decode_data': 2.5,
+    'decode_data_table': 2.5,
+}
+
+
+class TestStageProfiler(TestCase):
+    def test_profile(self):
+        encoder = HuffmanEncoder('ABRAKADABRA', 1)
+        profiler = StageProfiler(encoder, ['build_tree', 'unknown'])
+        results = profiler.profile(encoder.encode)
+        self.assertEqual(list(results), ['build_tree'])
+        self.assertGreater(results['build_tree']['peak'], 0)
+        stage = results['build_tree']
+        self.assertGreaterEqual(stage['peak'], stage['retained'])
+
+    def test_sample_text(self):
+        string = sample_text(1000)
+        self.assertEqual(len(string), 1000)
+        self.assertTrue(string.isascii())
+        self.assertEqual(sample_text(1000), string)
+
+
+class TestMemoryBudgets(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.string = sample_text(SIZE)
+
+    def assert_budgets(self, results, budgets):
+        for stage, memory in results.items():
+            with self.subTest(stage=stage):
+                self.assertLessEqual(memory['peak'] / SIZE, budgets[stage])
+
+    def test_encoder(self):
+        results = profile_encoder(self.string)
+        self.assertEqual(list(results), list(ENCODER_BUDGETS))
+        self.assert_budgets(results, ENCODER_BUDGETS)
+
+    def test_decoder(self):
+        data = HuffmanEncoder(self.string, 1).encode_bytes()
+        for engine in ['table', 'tree']:
+            self.assert_budgets(profile_decoder(data, engine), DECODER_BUDGETS)
+
+    def test_decoder_binary_string(self):
+        encoded_string = HuffmanEncoder(self.string, 1).encode()
+        results = profile_decoder(encoded_string, 'tree')
+        self.assertIn('decode_array', results)
+        self.assert_budgets(results, DECODER_BUDGETS)